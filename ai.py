@@ -1,7 +1,9 @@
 import math
-import pymunk
+import time
 from pymunk import Vec2d
 import gameobjects
+import pathfinding
+from targeting import Targeting
 from collections import defaultdict, deque
 
 # NOTE: use only 'map0' during development!
@@ -27,15 +29,34 @@ class Ai:
     a breadth first search. Also capable of shooting other tanks and or wooden
     boxes. """
 
-    def __init__(self, tank,  game_objects_list, tanks_list, space, currentmap):
+    USE_ASTAR           = False  # Search paths with A* instead of a breadth first search
+    MAX_EXPANSIONS      = 250000 # Give up on a path search after expanding that many tiles
+    EXPANSIONS_PER_TICK = 2000   # Spread the path searches that need more expansions over several ticks
+    UNREACHABLE_WAIT    = 25     # Number of ticks to wait before looking again for a path to a target that can't be reached
+
+    def __init__(self, tank,  game_objects_list, tanks_list, space, currentmap, flow_fields=None, grid=None, targeting=None):
+        """ flow_fields is an optional pathfinding.FlowFields shared with the other
+            AIs of the game. Without it, every AI searches its own paths.
+            grid is the live pathfinding.OccupancyGrid of the game, by default
+            the paths are searched on the boxes of the map as they were loaded.
+            targeting is an optional targeting.Targeting shared with the other AIs.
+        """
         self.tank               = tank
         self.game_objects_list  = game_objects_list
         self.tanks_list         = tanks_list
         self.space              = space
         self.currentmap         = currentmap
+        self.flow_fields        = flow_fields
+        self.grid               = grid if grid is not None else pathfinding.OccupancyGrid.from_map(currentmap)
+        self.targeting          = targeting if targeting is not None else Targeting(space, self.grid, tanks_list)
+        self.metalboxes_passable = False
+        self.path_key           = None # Start, target and grid version of the last searched path
         self.flag = None
-        self.MAX_X = currentmap.width - 1 
-        self.MAX_Y = currentmap.height - 1
+
+        # Set by an AiScheduler: whether we may look for a new path during this tick
+        self.may_replan         = True
+        self.replanned          = False # We looked for a new path during the last tick
+        self.deferred           = False # We had to wait for the scheduler during the last tick
 
         self.path = deque()
         self.move_cycle = self.move_cycle_gen()
@@ -47,6 +68,8 @@ class Ai:
 
     def decide(self):
         """ Main decision function that gets called on every tick of the game. """
+        self.replanned = False
+        self.deferred = False
 
         self.maybe_shoot()
         next(self.move_cycle)
@@ -55,44 +78,23 @@ class Ai:
 
 
     def maybe_shoot(self):
-        """ Makes a raycast query in front of the tank. If another tank
-            or a wooden box is found, then we shoot. 
+        """ Looks in front of the tank. If another tank
+            or a movable box is found, then we shoot. 
         """
-        x, y = self.tank.body.position
-
-        angle = self.tank.body.angle
-    
-        self.orientation = self.tank.body.angle + math.radians(45)
-
-        #Use same calculation as bullet spawn for finding front of tank
-        start_x = x - math.cos((angle - (math.pi)/2)) * 0.3
-
-        start_y = y - math.sin((angle - (math.pi)/2)) * 0.3
-
-        start = start_x, start_y
+        target = self.targeting.target(self.tank)
 
-        #Find end of ray casting using map.size
-        end_x = x - math.cos((angle - (math.pi)/2)) * (self.currentmap.width**2 * self.currentmap.height**2)**0.5
+        if isinstance(target, gameobjects.Tank):
+            self.shoot()
+        elif isinstance(target, gameobjects.Box) and target.movable:
+            self.shoot()
 
-        end_y = y - math.sin((angle - (math.pi)/2)) * (self.currentmap.width**2 * self.currentmap.height**2)**0.5
-
-        end = end_x, end_y
-        
-        ray = self.space.segment_query_first(start, end, 0, pymunk.ShapeFilter())
-
-        #Check if ray has .shape and if ray is movable box or tank. shoot if no cooldown
-        if hasattr(ray, "shape"):
-            if isinstance(ray.shape.parent, gameobjects.Box):
-                if ray.shape.parent.movable:
-                    if self.tank.shot_cooldown == 0:
-                        bullet = self.tank.shoot(self.space)
-                        self.game_objects_list.append(bullet)
-            
-            elif isinstance(ray.shape.parent, gameobjects.Tank):
-                if self.tank.shot_cooldown == 0:
-                    bullet = self.tank.shoot(self.space)
-                    self.game_objects_list.append(bullet)
-            
+    def shoot(self):
+        """ Fire a bullet. Bullets from a pool are already part of the game,
+            the others are added to the game objects.
+        """
+        bullet = self.tank.shoot(self.space)
+        if self.tank.bullet_pool is None:
+            self.game_objects_list.append(bullet)
 
     def move_cycle_gen (self):
         """ A generator that iteratively goes through all the required steps
@@ -101,12 +103,31 @@ class Ai:
         while True:
             
             last_position = (-1, -1)
+
+            #Wait until the scheduler lets us look for a path, without driving
+            #blindly on meanwhile
+            while not self.may_replan:
+                self.deferred = True
+                self.cease_accelerate()
+                self.cease_turn()
+                yield
+            self.replanned = True
+
             self.grid_pos = self.get_tile_of_position(Vec2d(self.tank.body.position))
             self.target = self.get_target_tile()
-            self.path = self.find_shortest_path(self.target)
+            self.path = yield from self.find_path_gen(self.target)
+
+            #If the target can't be reached from here, stay put (still shooting at
+            #whatever comes in front of us) and look again a bit later
+            if self.path is None:
+                self.cease_accelerate()
+                self.cease_turn()
+                for _ in range(self.UNREACHABLE_WAIT):
+                    yield
+                continue
 
             #Set tank path to flag or base depending on flag status
-            if not self.has_shortest_path():
+            if not self.path:
                 flag = self.get_flag()
                 self.tank.try_grab_flag(flag)
                 yield
@@ -130,13 +151,37 @@ class Ai:
                 yield
 
 
-    def has_shortest_path(self):
-        '''Return true or false if tank has shortest_path'''
-        if len(self.find_shortest_path(self.get_target_tile())) != 0:
-            return True
-        else:
-            return False
+    def find_path_gen(self, target):
+        """ A generator that returns the path to the target, or at least its next
+            step when the flow fields are shared. The path is empty once we are on
+            the target, and None if the target can't be reached.
+            The flag carried by another tank moves all the time: rather than a
+            flow field for every tile it goes through, we search our own path to it.
+            A flow field is built EXPANSIONS_PER_TICK expansions at a time, by the
+            AIs that need it: until it is ready we also search our own path, as
+            many expansions at a time, and use whichever is done first.
+        """
+        chasing_flag = self.tank.flag is None and self.get_flag().is_on_tank
+        if self.flow_fields is None or self.USE_ASTAR or chasing_flag:
+            return (yield from self.search_path_gen(target))
 
+        search = None
+        while True:
+            next_coord = self.flow_fields.next_step(self.grid_pos, target, self.EXPANSIONS_PER_TICK)
+            if next_coord is not pathfinding.SEARCHING:
+                break
+            if search is None:
+                search = self.search_path_gen(target)
+            try:
+                next(search)
+            except StopIteration as done:
+                return done.value
+            yield
+        if next_coord is not None:
+            return deque([next_coord])
+        if self.grid_pos == target:
+            return deque()
+        return None
 
     def correct_pos(self, next_coord, last_position):
         '''Return true or false if tank has driven past the next position'''
@@ -203,64 +248,71 @@ class Ai:
         self.tank.stop_moving()
 
     def find_shortest_path(self, target):
-        """ A simple Breadth First Search using integer coordinates as our nodes.
-            Edges are calculated as we go, using an external function.
+        """ Searches the shortest path from our tile to the target on the tile grid,
+            with a breadth first search (or A* if USE_ASTAR is set). Metal boxes
+            are only considered passable if there is no other way.
+            Returns an empty path if the target can't be reached at all.
         """
-        # Get the tank position
-        start = self.grid_pos
-
-        # Convert the start position from a vector to a typle so it is hashable
-        start_tuple = start.x, start.y
-
-        # Create the queue for the tiles that are about to be searched
-        queue = deque([(start, [start])])
-
-        # Create a set for the nodes that have already been visited
-        already_visited = set(start_tuple)
-
-        self.metalboxes_passable = False
+        path = self.get_cached_path(target)
+        if path is not None:
+            return path
+
+        for metalboxes_passable in (False, True):
+            self.metalboxes_passable = metalboxes_passable
+            path = pathfinding.search(self.grid, self.grid_pos, target, metalboxes_passable,
+                                      self.USE_ASTAR, self.MAX_EXPANSIONS)
+            if path is not None:
+                return self.found_path(path, target)
+
+        return deque()
+
+    def search_path_gen(self, target):
+        """ A generator doing the same search as find_shortest_path, but spread over
+            several ticks when it takes more than EXPANSIONS_PER_TICK expansions
+            (the tank stands still meanwhile). Returns None if the target can't
+            be reached, or if the search gave up after MAX_EXPANSIONS expansions.
+        """
+        path = self.get_cached_path(target)
+        if path is not None:
+            return path
 
-        shortest_path = None
+        for metalboxes_passable in (False, True):
+            search = self.new_search(target, metalboxes_passable)
+            while search.step(self.EXPANSIONS_PER_TICK) == pathfinding.SEARCHING:
+                self.cease_accelerate()
+                self.cease_turn()
+                yield
+            if search.status == pathfinding.FOUND:
+                return self.found_path(search.path, target)
 
-        # Loop through the queue
-        while queue:
+        return None
 
-            # Save the node and the path to the tile and pop the element
-            node, node_path = queue.popleft()
+    def new_search(self, target, metalboxes_passable):
+        """ Returns a new search for a path from our tile to the target. """
+        self.metalboxes_passable = metalboxes_passable
+        return pathfinding.PathSearch(self.grid, self.grid_pos, target, metalboxes_passable,
+                                      self.USE_ASTAR, self.MAX_EXPANSIONS)
 
-            # Break the loop if the current tile matches with the target
-            if node == target:
-                shortest_path = node_path[1:]
-                break
-                
-            # Check the neighbors of the current tile
-            for neighbor in self.get_tile_neighbors(Vec2d(node[0], node[1])):
-                
-                # Convert the neighbor to a tuple so it's hashable
-                neighbor_tuple = neighbor.x, neighbor.y
-                
-                # Check if the neighbor has already been visited
-                if not neighbor_tuple in already_visited:
-                    
-                    # Add the next tiles, and their corresponding path, to the queue
-                    neighbor_path = node_path + [neighbor]
-                    queue.append((neighbor, neighbor_path))
-                    already_visited.add((neighbor_tuple))
-            
-            # If the pathfinder goes through all possible paths and can't find anything, try to pathfind through metal boxes as well
-            if not queue and not self.metalboxes_passable:
-                self.metalboxes_passable = True
-                queue = deque([(self.grid_pos, [self.grid_pos])])
-                already_visited = set(start_tuple)
-            
-            # If the queue is empty and no path has been found, start over the pathfindes
-            if not queue and self.metalboxes_passable:
-                queue = deque([(self.grid_pos, [self.grid_pos])])
-                already_visited = set(start_tuple)
-            
-
-        return deque(shortest_path)
-            
+    def get_cached_path(self, target):
+        """ If nothing changed since the last search and we reached the first tile of
+            its path, the rest of that path is still the shortest one. Returns it,
+            or None if a new search is needed.
+        """
+        if self.path_key == (self.grid_pos, target, self.grid.version):
+            self.path_key = (self.path[0], target, self.grid.version) if self.path else None
+            return self.path
+        self.path_key = None
+        return None
+
+    def found_path(self, indices, target):
+        """ Converts the tile indices of a path found by a search back to coordinates. """
+        width = self.grid.width
+        path = deque(Vec2d(index % width, index // width) for index in indices)
+        # A path through metal boxes is only taken when there is no other way
+        # from here, which may not hold anymore further along the path
+        if path and not self.metalboxes_passable:
+            self.path_key = (path[0], target, self.grid.version)
+        return path
 
     def get_target_tile(self):
         """ Returns position of the flag if we don't have it. If we do have the flag,
@@ -279,11 +331,10 @@ class Ai:
             where it is when the Ai object is initialized.
         """
         if self.flag == None:
-        # Find the flag in the game objects list
-            for obj in self.game_objects_list:
-                if isinstance(obj, gameobjects.Flag):
-                    self.flag = obj
-                    break
+        # Find the flag in the game objects, which are indexed by type
+            for obj in self.game_objects_list.of_type(gameobjects.Flag):
+                self.flag = obj
+                break
         return self.flag
 
 
@@ -293,53 +344,78 @@ class Ai:
         return Vec2d(int(x), int(y))
 
 
-    def get_tile_neighbors(self, coord_vec):
-        """ Returns all bordering grid squares of the input coordinate.
-            A bordering square is only considered accessible if it is grass
-            or a wooden box.
-        """
-        x = coord_vec.x
-        y = coord_vec.y
-
-        # Find the coordinates of the tiles' four neighbors
-        # Start with the tile above the tank and goes clockwise from there
-        north_tile = Vec2d(x, y - 1)
-        east_tile = Vec2d(x + 1, y)
-        south_tile = Vec2d(x, y + 1)
-        west_tile = Vec2d(x - 1, y)
-
-        neighbors = [north_tile, east_tile, south_tile, west_tile] 
-
-        return list(filter(self.filter_tile_neighbors, neighbors))
-
-
-    def filter_tile_neighbors(self, coord):
-        '''Check if neighbor tiles are box or grass'''
-        x = coord.x
-        y = coord.y
+class AiScheduler:
+    """ Calls decide() on every AI every tick, so that they keep steering, but
+        spreads the expensive part, looking for a new path, over the ticks:
+        - the AIs take turns being first in line (round robin)
+        - once budget_ms milliseconds were spent on the AIs in a tick, or
+          max_replans of them looked for a path, the next ones have to wait
+          for a later tick (the first in line always may)
+        Without a budget nor max_replans, no AI ever waits. A budget in
+        milliseconds depends on the speed of the computer: games with one
+        don't play the same twice. An AI that waits stops its tank.
+        The budget is only checked between two AIs: it doesn't cap the work
+        of a single decide(), which Ai.EXPANSIONS_PER_TICK bounds instead (for
+        the path searches and the flow fields being built alike).
+    """
 
-        # If a tile can't be found at the coordinate, set the box type to a rockbox
-        try:
-            box_type = self.currentmap.boxAt(x, y)
-        except IndexError:
-            box_type = 1
-        
-        # If the map contains a lot of metal boxes, count them as passable
-        if self.metalboxes_passable:
-            barrier_types = [1]
-        else:
-            barrier_types = [1, 3]
-
-        # If the tile contains a passable neighbour return True
-        if (box_type in barrier_types or 
-            x > self.MAX_X or 
-            y > self.MAX_Y or 
-            x < 0 or 
-            y < 0):
-            
-            return False
-        else:
-            return True
+    def __init__(self, ai_list, budget_ms=None, max_replans=None):
+        self.ai_list            = ai_list
+        self.budget_ms          = budget_ms
+        self.max_replans        = max_replans
+        self.first              = 0 # Index of the AI that is first in line on the next tick
+
+        #-- Metrics
+        self.ticks              = 0
+        self.replans            = 0 # Number of times an AI looked for a path
+        self.deferred_replans   = 0 # Number of ticks an AI spent waiting to look for a path
+        self.over_budget_ticks  = 0 # Number of ticks where the AIs took more than budget_ms
+        self.total_ms           = 0.0
+        self.max_tick_ms        = 0.0
+
+    def run(self):
+        """ Let every AI decide what to do during this tick. """
+        start = time.perf_counter()
+        n_ais = len(self.ai_list)
+        replans = 0
+
+        for i in range(n_ais):
+            tank_ai = self.ai_list[(self.first + i) % n_ais]
+            tank_ai.may_replan = (i == 0
+                                  or ((self.budget_ms is None or (time.perf_counter() - start) * 1000 < self.budget_ms)
+                                      and (self.max_replans is None or replans < self.max_replans)))
+            tank_ai.decide()
+            replans += tank_ai.replanned
+            self.deferred_replans += tank_ai.deferred
+
+        # Without limits the order doesn't matter, keep the AIs in the order of the roster
+        if n_ais and (self.budget_ms is not None or self.max_replans is not None):
+            self.first = (self.first + 1) % n_ais
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.ticks += 1
+        self.replans += replans
+        self.total_ms += elapsed_ms
+        self.max_tick_ms = max(self.max_tick_ms, elapsed_ms)
+        if self.budget_ms is not None and elapsed_ms > self.budget_ms:
+            self.over_budget_ticks += 1
+
+    def metrics(self):
+        """ Returns the metrics of the scheduler, since the beginning of the game. """
+        return {
+            "ticks": self.ticks,
+            "replans": self.replans,
+            "deferred_replans": self.deferred_replans,
+            "over_budget_ticks": self.over_budget_ticks,
+            "mean_tick_ms": self.total_ms / self.ticks if self.ticks else 0.0,
+            "max_tick_ms": self.max_tick_ms,
+            }
+
+
+class AstarAi(Ai):
+    """ An Ai that searches its own paths with A* rather than a breadth first search. """
+
+    USE_ASTAR = True
 
 
 SimpleAi = Ai # Legacy
\ No newline at end of file
@@ -0,0 +1,139 @@
+""" Loads the images, fonts and sounds of the game the first time they are
+    used, and keeps them in a cache shared by the whole process, so that
+    importing the game costs nothing and headless runs never decode an asset.
+
+    Images are cached by path, size and transform: the same file scaled to
+    two sizes is two entries, each built once. How the files are loaded is up
+    to the backend:
+    - PygameBackend decodes the files (and converts the images for the
+      display, if there is one)
+    - NullBackend, for headless games, only reads the size of the images in
+      the header of the PNG files, and returns blank surfaces of that size
+      (the physics engine gets the size of the objects from their sprite),
+      no font and silent sounds
+"""
+import os
+import struct
+
+import pygame
+
+main_dir = os.path.split(os.path.abspath(__file__))[0]
+
+
+class PygameBackend:
+    """ Loads the assets with pygame. """
+
+    def load_image(self, path):
+        try:
+            surface = pygame.image.load(path)
+        except pygame.error:
+            raise SystemExit('Could not load image "%s" %s'%(path, pygame.get_error()))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        return surface
+
+    def load_font(self, path, size):
+        if not pygame.font.get_init():
+            pygame.font.init()
+        return pygame.font.Font(path, size)
+
+    def load_sound(self, path):
+        if pygame.mixer.get_init() is None:
+            pygame.mixer.init()
+        return pygame.mixer.Sound(path)
+
+
+class NullSound:
+    """ A sound that plays nothing. """
+
+    def play(self, *args, **kwargs):
+        return None
+
+    def stop(self):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+    def get_length(self):
+        return 0.0
+
+
+class NullBackend:
+    """ Loads nothing: blank images of the right size, no font, silent sounds. """
+
+    PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+    def load_image(self, path):
+        with open(path, "rb") as file:
+            header = file.read(24)
+        if header[:8] != self.PNG_SIGNATURE or header[12:16] != b"IHDR":
+            raise SystemExit(f'Could not read the size of image "{path}"')
+        # The IHDR chunk comes first, and starts with the width and height
+        width, height = struct.unpack(">II", header[16:24])
+        return pygame.Surface((width, height), pygame.SRCALPHA)
+
+    def load_font(self, path, size):
+        return None
+
+    def load_sound(self, path):
+        return NullSound()
+
+
+#-- The backend in use, and what it loaded
+backend = PygameBackend()
+cache   = {} # (kind, path, size, transform) -> asset
+
+
+def set_backend(new_backend):
+    """ Load the assets with new_backend from now on. The assets loaded by the
+        previous one are dropped.
+    """
+    global backend
+    backend = new_backend
+    cache.clear()
+
+
+def is_null():
+    """ Whether the assets are not really loaded (headless games). """
+    return isinstance(backend, NullBackend)
+
+
+def image(file, size=None, rotation=0):
+    """ Returns the image file of the data directory, scaled to size (in pixels)
+        and then rotated by rotation degrees.
+    """
+    key = ("image", file, size, rotation)
+    surface = cache.get(key)
+    if surface is None:
+        if size is None and rotation == 0:
+            surface = backend.load_image(os.path.join(main_dir, "data", file))
+        else:
+            surface = image(file)
+            if size is not None:
+                surface = pygame.transform.scale(surface, size)
+            if rotation != 0:
+                surface = pygame.transform.rotate(surface, rotation)
+        cache[key] = surface
+    return surface
+
+
+def font(file, size):
+    """ Returns the font file of the data directory, at size points. """
+    key = ("font", file, size, None)
+    if key not in cache:
+        cache[key] = backend.load_font(os.path.join(main_dir, "data", file), size)
+    return cache[key]
+
+
+def sound(file):
+    """ Returns the sound file of the Music directory. """
+    key = ("sound", file, None, None)
+    if key not in cache:
+        cache[key] = backend.load_sound(os.path.join(main_dir, "Music", file))
+    return cache[key]
+
+
+def clear():
+    """ Drop every asset loaded so far. """
+    cache.clear()
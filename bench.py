@@ -0,0 +1,265 @@
+""" Benchmarks of the hot paths of the game, on fixed scenarios, to tell
+    whether a change made the game slower.
+
+    Every scenario repeats one unit of work (a path search, a tick of a game,
+    a frame drawn) and reports how many it does per second, the latency of
+    each one (median and 99th percentile) and the peak memory allocated by
+    Python while setting it up and running it (measured in a separate run,
+    as tracemalloc slows everything down).
+
+    Scenarios:
+    - path/<map>        Ai.find_shortest_path from every tank to the flag
+    - ai_tick/<n>       ticks of a game with n tanks driven by AIs
+    - physics/<n>       ticks of the same game played back from its recorded
+                        commands: space.step and the update/post_update
+                        passes, without the AIs
+    - render/<map>      frames drawn by rendering.Renderer on a surface that
+                        isn't on the screen
+
+    Example:
+        python bench.py --output after.json --baseline before.json
+"""
+import argparse
+import fnmatch
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pygame
+import pymunk
+
+import world
+import assets
+import maps
+import mapgen
+import rendering
+import replay
+
+TOLERANCE = 0.1 # Slowdown from the baseline reported as a regression
+
+
+#-- Maps of the scenarios, generated ones are built the first time they are used
+GENERATED_MAPS = {
+    "gen40":    lambda: mapgen.generate(40, 40, seed=1, n_tanks=20),
+    "gen100":   lambda: mapgen.generate(100, 100, seed=1, n_tanks=8),
+    "gen300":   lambda: mapgen.generate(300, 300, seed=1, n_tanks=8),
+}
+generated_maps = {}
+
+
+def get_map(map_name):
+    if map_name in GENERATED_MAPS:
+        if map_name not in generated_maps:
+            generated_maps[map_name] = GENERATED_MAPS[map_name]()
+        return generated_maps[map_name]
+    return getattr(maps, map_name)
+
+
+def use_assets(real):
+    """ Load the sprites for real (to draw them) or use blank ones (headless games).
+        The sound effects stay muted.
+    """
+    world.setup_headless()
+    if real:
+        assets.set_backend(assets.PygameBackend())
+
+
+class ControlsRecorder:
+    """ Keeps the commands given to the tanks of a game, as replay.Recorder
+        does, but in memory.
+    """
+
+    def __init__(self):
+        self.controls = []
+
+    def record_tick(self, game, first_ai):
+        self.controls.append((first_ai, bytes(tank.controls for tank in game.tanks_list)))
+
+
+#-- Scenarios: each one returns the unit of work to repeat, and what to do
+#   between two of them (not measured) or None
+
+def path_scenario(map_name):
+    def setup(count):
+        use_assets(False)
+        game = world.World(get_map(map_name))
+        flag = game.ai_list[0].get_tile_of_position(pymunk.Vec2d(game.flag.x, game.flag.y))
+        ais = itertools.cycle(game.ai_list)
+
+        def step():
+            tank_ai = next(ais)
+            tank_ai.path_key = None # Search again, don't reuse the last path
+            tank_ai.find_shortest_path(flag)
+        return step, None
+    return setup
+
+
+def ai_tick_scenario(map_name):
+    def setup(count):
+        use_assets(False)
+        game = world.World(get_map(map_name))
+        return game.tick, None
+    return setup
+
+
+def physics_scenario(map_name):
+    def setup(count):
+        use_assets(False)
+        current_map = get_map(map_name)
+        game = world.World(current_map)
+        game.recorder = ControlsRecorder()
+        game.step(count)
+
+        playback = replay.ReplayWorld(current_map, [False] * len(game.tanks_list), game.recorder.controls)
+        return playback.tick, None
+    return setup
+
+
+def render_scenario(map_name):
+    def setup(count):
+        use_assets(True)
+        current_map = get_map(map_name)
+        game = world.World(current_map)
+        surface = pygame.Surface(current_map.rect().size)
+        renderer = rendering.Renderer(game, rendering.make_background(current_map))
+        return lambda: renderer.draw(surface), game.tick
+    return setup
+
+
+SCENARIOS = {
+    "path/map0":        (path_scenario("map0"), "search"),
+    "path/map1":        (path_scenario("map1"), "search"),
+    "path/map2":        (path_scenario("map2"), "search"),
+    "path/gen100":      (path_scenario("gen100"), "search"),
+    "path/gen300":      (path_scenario("gen300"), "search"),
+    "ai_tick/2":        (ai_tick_scenario("map2"), "tick"),
+    "ai_tick/6":        (ai_tick_scenario("map1"), "tick"),
+    "ai_tick/20":       (ai_tick_scenario("gen40"), "tick"),
+    "physics/2":        (physics_scenario("map2"), "tick"),
+    "physics/6":        (physics_scenario("map1"), "tick"),
+    "physics/20":       (physics_scenario("gen40"), "tick"),
+    "render/map1":      (render_scenario("map1"), "frame"),
+    "render/gen40":     (render_scenario("gen40"), "frame"),
+}
+
+
+def run(setup, count):
+    """ Runs a scenario count times, returns the time of every run in seconds. """
+    step, between = setup(count)
+    times = []
+    clock = time.perf_counter
+    for _ in range(count):
+        start = clock()
+        step()
+        times.append(clock() - start)
+        if between is not None:
+            between()
+    return times
+
+
+def peak_memory(setup, count):
+    """ Returns the peak of the memory allocated by Python, in bytes, while
+        setting up and running a scenario.
+    """
+    tracemalloc.start()
+    try:
+        run(setup, count)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def benchmark(name, count, repeat, memory=True):
+    """ Returns the results of the scenario called name. """
+    setup, unit = SCENARIOS[name]
+    times = []
+    rates = []
+    for _ in range(repeat):
+        run_times = run(setup, count)
+        times += run_times
+        rates.append(count / sum(run_times))
+    return {
+        "unit": unit,
+        "count": count,
+        "repeat": repeat,
+        "per_second": statistics.median(rates),
+        "p50_ms": percentile(times, 50) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "peak_memory_kb": peak_memory(setup, count) / 1024 if memory else None,
+        }
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """ Prints how the results compare to the baseline, returns the names of
+        the scenarios that got slower by more than tolerance.
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            print(f"{name:16} {result['per_second']:12.1f}/s  (not in the baseline)", file = sys.stderr)
+            continue
+        ratio = result["per_second"] / old["per_second"]
+        status = ""
+        if ratio < 1 - tolerance:
+            status = "SLOWER"
+            regressions.append(name)
+        elif ratio > 1 + tolerance:
+            status = "faster"
+        print(f"{name:16} {old['per_second']:12.1f}/s -> {result['per_second']:12.1f}/s  x{ratio:.2f}  "
+              f"p99 {old['p99_ms']:.3f} -> {result['p99_ms']:.3f} ms  {status}", file = sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the hot paths of the game")
+    parser.add_argument("-k", "--only", nargs = "+", default = ["*"], help = "Scenarios to run (shell patterns, like 'path/*')")
+    parser.add_argument("-n", "--count", type = int, default = 500, help = "Number of units of work of each scenario")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Number of runs of each scenario")
+    parser.add_argument("--no-memory", action = "store_true", help = "Don't measure the peak memory")
+    parser.add_argument("-o", "--output", help = "Write the results to this JSON file")
+    parser.add_argument("--baseline", help = "Compare the results to this JSON file, written by an earlier run")
+    parser.add_argument("--tolerance", type = float, default = TOLERANCE, help = "Slowdown reported as a regression")
+    parser.add_argument("--list", action = "store_true", help = "List the scenarios")
+    args = parser.parse_args()
+
+    names = [name for name in SCENARIOS if any(fnmatch.fnmatch(name, pattern) for pattern in args.only)]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scenarios": {},
+        }
+    for name in names:
+        results["scenarios"][name] = benchmark(name, args.count, args.repeat, not args.no_memory)
+        result = results["scenarios"][name]
+        print(f"{name:16} {result['per_second']:12.1f} {result['unit']}/s  p50 {result['p50_ms']:.3f} ms  "
+              f"p99 {result['p99_ms']:.3f} ms", file = sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent = 2)
+    else:
+        print(json.dumps(results, indent = 2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
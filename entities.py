@@ -0,0 +1,72 @@
+import gameobjects
+
+
+class EntityRegistry:
+    """ The objects of a game, indexed so that the world never has to scan all of them:
+        - every object gets an id that stays the same as long as it is in the game
+        - the objects are grouped by type
+        - the objects that need update(), post_update() or to be drawn are kept
+          in separate sets, so that objects which do nothing every tick (boxes
+          that are not moving, for instance) cost nothing
+        All of them are dicts used as ordered sets: adding and removing objects
+        is O(1), and objects are iterated in the order they were added, as in a list.
+        The registry can be used like the list of game objects it replaces
+        (append, remove, iteration, len, in).
+    """
+
+    def __init__(self):
+        self.next_id        = 0
+        self.entities       = {} # Objects by id
+        self.types          = {} # Objects of each type
+        self.updating       = {} # Objects that implement update()
+        self.post_updating  = {} # Objects that implement post_update()
+        self.rendering      = {} # Objects that are drawn on the screen
+
+    def add(self, obj):
+        """ Add an object and return its id. """
+        obj.entity_id = self.next_id
+        self.next_id += 1
+        self.entities[obj.entity_id] = obj
+        self.types.setdefault(type(obj), {})[obj] = True
+        if type(obj).update is not gameobjects.GameObject.update:
+            self.updating[obj] = True
+        if type(obj).post_update is not gameobjects.GameObject.post_update:
+            self.post_updating[obj] = True
+        if obj.sprite is not None:
+            self.rendering[obj] = True
+        return obj.entity_id
+
+    def append(self, obj):
+        self.add(obj)
+
+    def remove(self, obj):
+        """ Remove an object, raises ValueError if it isn't in the registry (like list.remove). """
+        if self.entities.get(getattr(obj, "entity_id", None)) is not obj:
+            raise ValueError("The object is not in the registry")
+        del self.entities[obj.entity_id]
+        del self.types[type(obj)][obj]
+        self.updating.pop(obj, None)
+        self.post_updating.pop(obj, None)
+        self.rendering.pop(obj, None)
+
+    def discard(self, obj):
+        """ Remove an object if it is in the registry. """
+        if obj in self:
+            self.remove(obj)
+
+    def get(self, entity_id):
+        """ Returns the object with that id, or None. """
+        return self.entities.get(entity_id)
+
+    def of_type(self, cls):
+        """ The objects of class cls (not the ones of its subclasses). """
+        return self.types.get(cls, {}).keys()
+
+    def __iter__(self):
+        return iter(list(self.entities.values()))
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __contains__(self, obj):
+        return self.entities.get(getattr(obj, "entity_id", None)) is obj
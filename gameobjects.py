@@ -1,27 +1,118 @@
+import assets
 import images
 import pygame
 import pymunk
 import math
+import sounds
+from collections import OrderedDict
+
+try:
+    import numpy # Only used to update many tanks at once, see update_tanks()
+except ImportError:
+    numpy = None
 
 DEBUG = False # Change this to set it in debug mode
 
+#-- Collision types of the physics shapes
+COLLISION_BULLET    = 1
+COLLISION_TANK      = 2
+COLLISION_BOX       = 3
+
+#-- Commands given to a tank during a tick, as bits of Tank.controls
+CONTROL_ACCEL       = 1   # accelerate()
+CONTROL_DECEL       = 2   # decelerate()
+CONTROL_STOP        = 4   # stop_moving()
+CONTROL_LEFT        = 8   # turn_left()
+CONTROL_RIGHT       = 16  # turn_right()
+CONTROL_STOP_TURN   = 32  # stop_turning()
+CONTROL_FIRE        = 64  # shoot()
+CONTROL_GRAB        = 128 # try_grab_flag()
+
+#-- Number of tanks from which update_tanks() updates them with numpy: below
+#   that, filling the arrays costs more than it saves (measured)
+BATCH_MIN_TANKS     = 8
+
 
 def physics_to_display(x):
     """ This function is used to convert coordinates in the physic engine into the display coordinates """
     return x * images.TILE_SIZE
 
 
+def __getattr__(name):
+    """ The font is only loaded the first time gameobjects.font is used. """
+    if name == "font":
+        return assets.font("arcadefont.ttf", 16)
+    raise AttributeError(f"module 'gameobjects' has no attribute '{name}'")
 
-font = pygame.font.Font("data/arcadefont.ttf", 16)
+
+class RotationCache:
+    """ Keeps the most recently used rotated sprites, so that objects which
+        don't turn (boxes, bases...) don't rotate their sprite on every frame.
+        Angles are rounded to angle_step degrees, and the least recently used
+        sprite is dropped once the cache holds max_size of them.
+    """
+
+    def __init__(self, max_size=2048, angle_step=1):
+        self.max_size   = max_size
+        self.angle_step = angle_step
+        self.cache      = OrderedDict()
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+
+    def rotate(self, sprite, angle):
+        """ Returns the sprite rotated by angle (in degrees). """
+        bucket = round(angle / self.angle_step) % round(360 / self.angle_step)
+        key = (id(sprite), bucket)
+
+        entry = self.cache.get(key)
+        # The sprite is kept in the entry so that a new sprite reusing the id of a
+        # collected one doesn't get its rotations
+        if entry is not None and entry[0] is sprite:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        rotated = pygame.transform.rotate(sprite, bucket * self.angle_step)
+        self.cache[key] = (sprite, rotated)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return rotated
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+rotation_cache = RotationCache()
 
 class GameObject:
     """ Mostly handles visual aspects (pygame) of an object.
         Subclasses need to implement two functions:
         - screen_position    that will return the position of the object on the screen
-        - screen_orientation that will return how much the object is rotated on the screen (in degrees). """
+        - screen_orientation that will return how much the object is rotated on the screen (in degrees).
+        Objects that are no longer alive are taken out of the game by the world
+        at the end of the tick. """
+
+    # Whether the world keeps the despawned objects of this class, to spawn them again
+    pooled = False
 
     def __init__(self, sprite):
         self.sprite         = sprite
+        self.alive          = True
+
+    def despawn(self):
+        """ Take the object out of the game at the end of the tick. """
+        self.alive = False
+
+    def respawn(self, *args):
+        """ Brings a despawned object of a pooled class back into the game, takes the
+            same arguments as the constructor. By default the object is built again in
+            place: pooled subclasses that only need to reset a few fields override it."""
+        self.__init__(*args)
 
     def update(self):
         """ Placeholder, supposed to be implemented in a subclass.
@@ -35,11 +126,11 @@ class GameObject:
 
     def update_screen(self, screen):
         """ Updates the visual part of the game. Should NOT need to be changed
-            by a subclass."""
+            by a subclass. Returns the area of the screen that was drawn on."""
         sprite = self.sprite
 
         p = self.screen_position() # Get the position of the object (pygame coordinates)
-        sprite = pygame.transform.rotate(sprite, self.screen_orientation()) # Rotate the sprite using the rotation of the object
+        sprite = rotation_cache.rotate(sprite, self.screen_orientation()) # Rotate the sprite using the rotation of the object
 
         # The position of the screen correspond to the center of the object,
         # but the function screen.blit expect to receive the top left corner
@@ -48,7 +139,7 @@ class GameObject:
         # corner of the sprite
         offset = pymunk.Vec2d(sprite.get_size()) / 2.
         p = p - offset
-        screen.blit(sprite, p) # Copy the sprite on the screen
+        return screen.blit(sprite, p) # Copy the sprite on the screen
 
 
 class GamePhysicsObject(GameObject):
@@ -110,14 +201,15 @@ class GamePhysicsObject(GameObject):
         return -math.degrees(self.body.angle)
 
     def update_screen(self, screen):
-        super().update_screen(screen)
+        rect = super().update_screen(screen)
         # debug draw
         if DEBUG:
             ps = [self.body.position+p for p in self.points]
 
             ps = [physics_to_display(p) for p in ps]
             ps += [ps[0]]
-            pygame.draw.lines(screen, pygame.color.THECOLORS["red"], False, ps, 1)
+            rect = rect.union(pygame.draw.lines(screen, pygame.color.THECOLORS["red"], False, ps, 1))
+        return rect
 
 
 def clamp(min_max, value):
@@ -130,45 +222,123 @@ class Bullet(GamePhysicsObject):
 
     # Bullet speed
     SPEED = 7.0
-    bullet_sound = pygame.mixer.Sound("Music/shoot_1.wav")
+    # Number of ticks after which a bullet that hit nothing disappears
+    MAX_LIFETIME = 150
 
     def __init__(self, shooter, space):
-        
+
+        # Give the bullet a texture
+        sprite = images.bullet
+
+        # Parent initiation, in front of the shooter
+        x, y = self.spawn_position(shooter)
+        super().__init__(x, y, 0, sprite, space, True)
+
+        # Give the bullet a collision type
+        self.shape.collision_type = COLLISION_BULLET
+        self.shape.parent = self
+
+        # The pool that recycles this bullet, if any
+        self.pool = None
+
+        self.launch(shooter)
+
+    @staticmethod
+    def spawn_position(shooter):
+        """ Returns the position of the front of the shooter, where its bullets appear. """
         # Define variables, used to determine the bullets origin in relation to the tank
         x, y = shooter.body.position
 
         angle = shooter.body.angle
-    
-        self.orientation = shooter.body.angle + math.radians(45)
 
         x = x - math.cos((angle - (math.pi)/2)) * 0.3
 
         y = y - math.sin((angle - (math.pi)/2)) * 0.3
 
-        # Give the bullet a texture
-        sprite = images.bullet
+        return x, y
 
-        # Parent initiation
-        super().__init__(x, y, 0, sprite, space, True)
+    def launch(self, shooter):
+        """ Fire the bullet from the front of the shooter. Also used to fire
+            again a bullet that is recycled by a BulletPool.
+        """
+        x, y = self.spawn_position(shooter)
 
-        # Set object velocity
-        self.body.velocity = pymunk.Vec2d(self.SPEED, self.SPEED).rotated(self.orientation)
+        self.orientation = shooter.body.angle + math.radians(45)
 
-        # Give the bullet a collision type
-        self.shape.collision_type = 1
-        self.shape.parent = self
+        # Remember who fired the bullet, to credit the kill
+        self.shooter = shooter
+
+        self.body.position = x, y
+        self.body.angle = 0
+        self.body.angular_velocity = 0
+        self.start_position = pymunk.Vec2d(x, y)
+        self.lifetime = self.MAX_LIFETIME
 
-        self.bullet_sound.play()
+        # Set object velocity
+        self.body.velocity = pymunk.Vec2d(self.SPEED, self.SPEED).rotated(self.orientation)
 
-    
     def update(self):
         """Counter grass friction"""
-        
+
         # Creates a vector in the direction we want accelerate / decelerate
         acceleration_vector = pymunk.Vec2d(1, 1).rotated(self.orientation)
         # Applies the vector to our velocity
         self.body.velocity += acceleration_vector
-     
+
+    def post_update(self):
+        """ Count down the lifetime of the bullet. """
+        self.lifetime -= 1
+
+
+class BulletPool:
+    """ Recycles bullets: the bullets that hit something or flew for too long
+        are taken out of the physics engine and kept, with their body and
+        shape, to be fired again instead of building new ones.
+    """
+
+    def __init__(self, space, max_range=None):
+        """ Bullets disappear after Bullet.MAX_LIFETIME ticks, or once they are further
+            than max_range from where they were fired.
+        """
+        self.space      = space
+        self.max_range  = max_range
+        self.free       = [] # Bullets waiting to be fired again
+        self.live       = {} # Bullets in the game (a dict is used as an ordered set)
+
+    def acquire(self, shooter):
+        """ Fire a bullet from the shooter, recycling one if possible. """
+        if self.free:
+            bullet = self.free.pop()
+            # The physics engine keeps, in the body of a bullet that hit something, the
+            # correction of the position it computed for the collision, and would apply
+            # it the next time the bullet moves: integrating the position over no time
+            # at all clears it, without moving the body
+            pymunk.Body.update_position(bullet.body, 0)
+            bullet.launch(shooter)
+            self.space.add(bullet.body, bullet.shape)
+        else:
+            bullet = Bullet(shooter, self.space)
+            bullet.pool = self
+        bullet.alive = True
+        self.live[bullet] = True
+        return bullet
+
+    def release(self, bullet):
+        """ Take the bullet out of the game, to be fired again later. """
+        if self.live.pop(bullet, None) is None:
+            return
+        bullet.despawn()
+        self.space.remove(bullet.shape, bullet.body)
+        self.free.append(bullet)
+
+    def expire(self):
+        """ Release the bullets that flew for too long or too far. """
+        for bullet in list(self.live):
+            if bullet.lifetime <= 0:
+                self.release(bullet)
+            elif self.max_range is not None and bullet.start_position.get_distance(bullet.body.position) > self.max_range:
+                self.release(bullet)
+
 
 class Tank(GamePhysicsObject):
     """ Extends GamePhysicsObject and handles aspects which are specific to our tanks."""
@@ -181,10 +351,19 @@ class Tank(GamePhysicsObject):
 
     def __init__(self, x, y, orientation, sprite, space, scoreboard):
         super().__init__(x, y, orientation, sprite, space, True)
+
+        # Give the tank a collision type
+        self.shape.collision_type = COLLISION_TANK
+
         # Define variable used to apply motion to the tanks
         self.acceleration = 0 # 1 forward, 0 for stand still, -1 for backwards
         self.rotation = 0 # 1 clockwise, 0 for no rotation, -1 counter clockwise
 
+        # The commands given to the tank since the world reset them (CONTROL_* bits). A command
+        # cancels the earlier ones it overrides, so that giving the remaining ones in the order
+        # of apply_controls() has the same effect
+        self.controls = 0
+
         # Define other tank attributes
         self.flag                 = None                      # This variable is used to access the flag object, if the current tank is carrying the flag
         self.max_speed        = Tank.NORMAL_MAX_SPEED     # Impose a maximum speed to the tank
@@ -199,34 +378,45 @@ class Tank(GamePhysicsObject):
         # Set shot cooldown:
         self.shot_cooldown = 0
 
+        # Pool that recycles the bullets of the tank, if any
+        self.bullet_pool = None
+
     def accelerate(self):
         """ Call this function to make the tank move forward. """
         self.acceleration = 1
+        self.controls = (self.controls & ~CONTROL_DECEL) | CONTROL_ACCEL
 
     def stop_moving(self):
         """ Call this function to make the tank stop moving. """
         self.acceleration  = 0
         self.body.velocity = pymunk.Vec2d.zero()
+        self.controls = (self.controls & ~(CONTROL_ACCEL | CONTROL_DECEL)) | CONTROL_STOP
 
     def decelerate(self):
         """ Call this function to make the tank move backward. """
         self.acceleration = -1
+        self.controls = (self.controls & ~CONTROL_ACCEL) | CONTROL_DECEL
 
     def turn_left(self):
         """ Makes the tank turn left (counter clock-wise). """
         self.rotation = -1
+        self.controls = (self.controls & ~CONTROL_RIGHT) | CONTROL_LEFT
 
     def turn_right(self):
         """ Makes the tank turn right (clock-wise). """
         self.rotation = 1
+        self.controls = (self.controls & ~CONTROL_LEFT) | CONTROL_RIGHT
 
     def stop_turning(self):
         """ Call this function to make the tank stop turning. """
         self.rotation = 0
         self.body.angular_velocity = 0
+        self.controls = (self.controls & ~(CONTROL_LEFT | CONTROL_RIGHT)) | CONTROL_STOP_TURN
 
     def update(self):
-        """ A function to update the objects coordinates. Gets called at every tick of the game. """
+        """ A function to update the objects coordinates. Gets called at every tick of the game.
+            update_tanks() does the same for many tanks at once.
+        """
 
         # Creates a vector in the direction we want accelerate / decelerate
         acceleration_vector = pymunk.Vec2d(0, self.ACCELERATION * self.acceleration).rotated(self.body.angle)
@@ -242,14 +432,10 @@ class Tank(GamePhysicsObject):
         self.body.angular_velocity += self.rotation * self.ACCELERATION
         self.body.angular_velocity = clamp(self.max_speed, self.body.angular_velocity)
 
-        # Give the tank a collision type
-        self.shape.collision_type = 2
-        self.shape.parent = self
-
     def update_screen(self, screen):
-        super().update_screen(screen)
+        rect = super().update_screen(screen)
 
-        self.scoreboard.update_screen(screen)
+        return rect.union(self.scoreboard.update_screen(screen))
 
 
     def post_update(self):
@@ -288,6 +474,8 @@ class Tank(GamePhysicsObject):
         """ Call this function to try to grab the flag, if the flag is not on other tank
             and it is close to the current tank, then the current tank will grab the flag.
         """
+        self.controls |= CONTROL_GRAB
+
         # Check that the flag is not on other tank
         if(not flag.is_on_tank):
             # Check if the tank is close to the flag
@@ -308,11 +496,61 @@ class Tank(GamePhysicsObject):
         # Set the shot cooldown
         self.shot_cooldown = 50
         self.lasthit = 250
+        self.controls |= CONTROL_FIRE
+
+        sounds.play("shoot")
 
         # Return the bullet
+        if self.bullet_pool is not None:
+            return self.bullet_pool.acquire(self)
         return Bullet(self, space)
 
 
+def update_tanks(tanks):
+    """ Does the same as calling update() on each of the tanks, but with the state of
+        all the tanks in numpy arrays, updated in a single pass. Reading and writing
+        the bodies still costs a little per tank, so below BATCH_MIN_TANKS tanks (or
+        without numpy) the tanks are simply updated one by one.
+        The results are the same to the last bit as the ones of update(), so that
+        games don't depend on numpy: the arithmetic is done in the same order, and
+        the sines, cosines, arc tangents and squares come from the math module as
+        in pymunk.Vec2d (the ones of numpy may be rounded differently).
+    """
+    if numpy is None or len(tanks) < BATCH_MIN_TANKS:
+        for tank in tanks:
+            tank.update()
+        return
+
+    bodies          = [tank.body for tank in tanks]
+    angles          = [body.angle for body in bodies]
+    velocities      = numpy.array([tuple(body.velocity) for body in bodies])
+    angular         = numpy.array([body.angular_velocity for body in bodies])
+    accelerations   = numpy.array([tank.ACCELERATION * tank.acceleration for tank in tanks], dtype=float)
+    rotations       = numpy.array([tank.rotation * tank.ACCELERATION for tank in tanks], dtype=float)
+    max_speeds      = numpy.array([tank.max_speed for tank in tanks], dtype=float)
+
+    # Accelerate along the tank: the vector (0, acceleration) rotated by the angle of the tank
+    cos = numpy.array([math.cos(angle) for angle in angles])
+    sin = numpy.array([math.sin(angle) for angle in angles])
+    vx  = velocities[:, 0] + (0.0 * cos - accelerations * sin)
+    vy  = velocities[:, 1] + (0.0 * sin + accelerations * cos)
+
+    # Keep the direction of the velocity but not more than the speed limit
+    squares     = [x**2 + y**2 for x, y in zip(vx.tolist(), vy.tolist())]
+    directions  = [math.atan2(y, x) if square != 0 else 0 for x, y, square in zip(vx.tolist(), vy.tolist(), squares)]
+    speeds      = numpy.clip(numpy.sqrt(squares), -max_speeds, max_speeds)
+    cos         = numpy.array([math.cos(direction) for direction in directions])
+    sin         = numpy.array([math.sin(direction) for direction in directions])
+    vx          = speeds * cos - 0.0 * sin
+    vy          = speeds * sin + 0.0 * cos
+
+    # Turn, not faster than the speed limit either
+    angular     = numpy.clip(angular + rotations, -max_speeds, max_speeds)
+
+    for body, x, y, w in zip(bodies, vx.tolist(), vy.tolist(), angular.tolist()):
+        body.velocity           = x, y
+        body.angular_velocity   = w
+
 class Box(GamePhysicsObject):
     """ This class extends the GamePhysicsObject to handle box objects. """
 
@@ -321,7 +559,7 @@ class Box(GamePhysicsObject):
         super().__init__(x, y, 0, sprite, space, movable)
         self.destructable = destructable
         self.movable = movable
-        self.shape.collision_type = 3
+        self.shape.collision_type = COLLISION_BOX
 
 def get_box_with_type(x, y, type, space):
     (x, y) = (x + 0.5, y + 0.5) # Offsets the coordinate to the center of the tile
@@ -350,6 +588,10 @@ class GameVisibleObject(GameObject):
         return self.orientation
 
 class Explosion(GameVisibleObject):
+    """ An explosion that is shown for a while, then despawns. """
+
+    pooled = True
+
     def __init__(self, x, y):
 
         sprite = images.explosion
@@ -357,13 +599,18 @@ class Explosion(GameVisibleObject):
         super().__init__(x, y, sprite)
         self.explosion_timer = 50
 
+    def respawn(self, x, y):
+        self.x, self.y = x, y
+        self.explosion_timer = 50
+
     def post_update(self):
         if self.explosion_timer > 0:
             self.explosion_timer -= 1
 
         if self.explosion_timer == 0:
-            self.sprite = images.transparent
-        
+            self.despawn()
+
+
 class Scoreboard(GameVisibleObject):
     def __init__(self, x, y, sprite):
         super().__init__(x, y, sprite)
@@ -372,7 +619,8 @@ class Scoreboard(GameVisibleObject):
 
     def add_score(self):
         self.current_score += 1
-        self.show_score = images.new_scoreboard[self.current_score]
+        # There are only digit sprites for the first scores, keep showing the last one after that
+        self.show_score = images.new_scoreboard[min(self.current_score, len(images.new_scoreboard) - 1)]
 
 class Flag(GameVisibleObject):
     """ This class extends GameVisibleObject for representing flags."""
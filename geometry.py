@@ -0,0 +1,64 @@
+import pymunk
+
+import gameobjects
+
+
+def merge_tiles(grid, box_type):
+    """ Cover the tiles of grid that hold box_type with as few rectangles as
+        possible, with a greedy merge: starting from the first tile that isn't
+        covered yet, a rectangle grows along the row, then down as long as the
+        whole span of the next row can be covered too.
+        Returns the rectangles as (x, y, width, height) in tiles.
+    """
+    width       = grid.width
+    height      = grid.height
+    tiles       = grid.tiles
+    covered     = bytearray(width * height)
+    rectangles  = []
+
+    def free(index):
+        return tiles[index] == box_type and not covered[index]
+
+    for y in range(height):
+        for x in range(width):
+            if not free(y * width + x):
+                continue
+
+            # Grow along the row
+            w = 1
+            while x + w < width and free(y * width + x + w):
+                w += 1
+
+            # Grow down, one whole row at a time
+            h = 1
+            while y + h < height and all(free((y + h) * width + i) for i in range(x, x + w)):
+                h += 1
+
+            for j in range(y, y + h):
+                for i in range(x, x + w):
+                    covered[j * width + i] = 1
+            rectangles.append((x, y, w, h))
+
+    return rectangles
+
+
+def boundary_rectangles(width, height, thickness=2):
+    """ The rectangles of a ring, thickness tiles thick, around a map of width x height tiles. """
+    return [(-thickness, -thickness, width + 2 * thickness, thickness), # Top, with the corners
+            (-thickness, height, width + 2 * thickness, thickness),     # Bottom, with the corners
+            (-thickness, 0, thickness, height),                         # Left
+            (width, 0, thickness, height)]                              # Right
+
+
+def add_static_rectangles(space, rectangles):
+    """ Add the rectangles to the static body of the space, as walls that the
+        other objects collide with like with rock boxes. Returns the shapes.
+    """
+    shapes = []
+    for x, y, w, h in rectangles:
+        shape = pymunk.Poly(space.static_body, [(x, y), (x, y + h), (x + w, y + h), (x + w, y)])
+        shape.collision_type = gameobjects.COLLISION_BOX
+        shape.parent = None # Not a game object: shots don't do anything to it
+        shapes.append(shape)
+    space.add(*shapes)
+    return shapes
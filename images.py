@@ -1,52 +1,44 @@
-import pygame
-import os
+import assets
 
-main_dir = os.path.split(os.path.abspath(__file__))[0]
+#-- The images are only loaded the first time they are used (see assets.py):
+#   images.grass, for instance, is looked up in IMAGES by __getattr__ below.
 
 def load_image(file):
     """ Load an image from the data directory. """
-    file = os.path.join(main_dir, 'data', file)
-    try:
-        surface = pygame.image.load(file)
-    except pygame.error:
-        raise SystemExit('Could not load image "%s" %s'%(file, pygame.get_error()))
-    return surface.convert_alpha()
+    return assets.image(file)
 
 
 TILE_SIZE = 40 # Define the default size of tiles
- 
-explosion = load_image('explosion.png') # Image of an explosion
- 
-grass     = load_image('grass.png') # Image of a grass tile
 
-rockbox   = load_image('rockbox.png') # Image of a rock box (wall)
-
-metalbox  = load_image('metalbox.png') # Image of a metal box
-
-woodbox   = load_image('woodbox.png') # Image of a wood box
-
-flag      = load_image('flag.png') # Image of flag
-
-menu_button = load_image("menu_button.png") # Image of a menu button
-
-transparent = load_image('transparent.png') # Transparent image
-big_scoreboard = [load_image('zero.png'), load_image('one.png'), load_image('two.png')]
-new_scoreboard = []
-
-#Resize all pictures in scoreboard to same size
-for picture in big_scoreboard:
-    new_scoreboard.append(pygame.transform.scale(picture, (20, 20)))
-
-
-
-bullet = load_image('bullet.png')
-bullet = pygame.transform.scale(bullet, (10, 10))
-bullet = pygame.transform.rotate(bullet, -90)
-
-# List of image of tanks of different colors
-tanks     = [load_image('tank_orange.png'), load_image('tank_blue.png'), load_image('tank_white.png'),
-             load_image('tank_yellow.png'), load_image('tank_red.png'),  load_image('tank_gray.png')]
-
-# List of image of bases corresponding to the color of each tank
-bases     = [load_image('base_orange.png'), load_image('base_blue.png'), load_image('base_white.png'),
-             load_image('base_yellow.png'), load_image('base_red.png'),  load_image('base_gray.png')]
+IMAGES = {
+    "explosion":    lambda: load_image('explosion.png'), # Image of an explosion
+    "grass":        lambda: load_image('grass.png'), # Image of a grass tile
+    "rockbox":      lambda: load_image('rockbox.png'), # Image of a rock box (wall)
+    "metalbox":     lambda: load_image('metalbox.png'), # Image of a metal box
+    "woodbox":      lambda: load_image('woodbox.png'), # Image of a wood box
+    "flag":         lambda: load_image('flag.png'), # Image of flag
+    "menu_button":  lambda: load_image("menu_button.png"), # Image of a menu button
+    "transparent":  lambda: load_image('transparent.png'), # Transparent image
+
+    "big_scoreboard": lambda: [load_image('zero.png'), load_image('one.png'), load_image('two.png')],
+    # All the pictures of the scoreboard resized to the same size
+    "new_scoreboard": lambda: [assets.image(file, (20, 20)) for file in ('zero.png', 'one.png', 'two.png')],
+
+    "bullet":       lambda: assets.image('bullet.png', (10, 10), -90),
+
+    # List of image of tanks of different colors
+    "tanks":        lambda: [load_image('tank_orange.png'), load_image('tank_blue.png'), load_image('tank_white.png'),
+                             load_image('tank_yellow.png'), load_image('tank_red.png'),  load_image('tank_gray.png')],
+
+    # List of image of bases corresponding to the color of each tank
+    "bases":        lambda: [load_image('base_orange.png'), load_image('base_blue.png'), load_image('base_white.png'),
+                             load_image('base_yellow.png'), load_image('base_red.png'),  load_image('base_gray.png')],
+}
+
+
+def __getattr__(name):
+    """ Returns the image (or list of images) called name, loading it if needed. """
+    loader = IMAGES.get(name)
+    if loader is None:
+        raise AttributeError(f"module 'images' has no attribute '{name}'")
+    return loader()
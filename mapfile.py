@@ -0,0 +1,128 @@
+""" Maps in files: a small header followed by the box type of every tile, one
+    byte per tile. Loading a map maps the file in memory instead of reading it,
+    and the boxes are read straight from the file, so that libraries of many
+    (or very large) maps cost nothing until their tiles are used.
+
+    File format, little endian:
+    - HEADER: magic, version, width, height, number of start positions
+    - every start position as 3 doubles (x, y, orientation in degrees)
+    - the flag position as 2 doubles
+    - the grid: width * height bytes, row after row (see pathfinding.py for
+      the box types)
+
+    Example, to write the maps of maps.py to files:
+        python mapfile.py map0 map1 map2 --output arenas/
+"""
+import argparse
+import mmap
+import os
+import struct
+
+import maps
+
+MAGIC       = b"CTFM"
+VERSION     = 1
+EXTENSION   = ".ctfm"
+HEADER      = struct.Struct("<4sBHHH") # Magic, version, width, height, number of start positions
+START       = struct.Struct("<3d")     # x, y, orientation
+FLAG        = struct.Struct("<2d")     # x, y
+
+
+class MapFormatError(Exception):
+    """ The file isn't a map this version can read. """
+
+
+class TileMap(maps.Map):
+    """ A map whose boxes are read from a buffer of width * height bytes (for
+        instance a file mapped in memory) instead of lists of lists.
+    """
+
+    def __init__(self, width, height, tiles, start_positions, flag_position):
+        if len(tiles) != width * height:
+            raise ValueError(f"A map of {width}x{height} tiles needs {width * height} bytes, not {len(tiles)}")
+        self.width              = width
+        self.height             = height
+        self.tiles              = tiles
+        self.start_positions    = start_positions
+        self.flag_position      = flag_position
+
+    @property
+    def boxes(self):
+        """ The box types as a list of rows, as in maps.py (built on every call). """
+        return [list(self.tiles[y * self.width:(y + 1) * self.width]) for y in range(self.height)]
+
+    def boxAt(self, x, y):
+        """ Return the type of the box at coordinates (x, y). """
+        return self.tiles[y * self.width + x]
+
+    def tile_bytes(self):
+        return self.tiles
+
+
+def dumps(current_map):
+    """ Returns the content of the file of current_map. """
+    data = [HEADER.pack(MAGIC, VERSION, current_map.width, current_map.height, len(current_map.start_positions))]
+    for x, y, orientation in current_map.start_positions:
+        data.append(START.pack(x, y, orientation))
+    data.append(FLAG.pack(*current_map.flag_position))
+    data.append(bytes(current_map.tile_bytes()))
+    return b"".join(data)
+
+
+def save(current_map, path):
+    """ Write current_map to the file at path. """
+    with open(path, "wb") as file:
+        file.write(dumps(current_map))
+
+
+def loads(data, path="the data"):
+    """ Returns the TileMap stored in data (bytes, or any buffer such as a
+        memory mapped file). Its tiles are a view of data, not a copy.
+    """
+    if len(data) < HEADER.size:
+        raise MapFormatError(f"{path} is too short to be a map")
+    magic, version, width, height, n_starts = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise MapFormatError(f"{path} isn't a map of version {VERSION}")
+
+    offset = HEADER.size
+    start_positions = []
+    for _ in range(n_starts):
+        start_positions.append(list(START.unpack_from(data, offset)))
+        offset += START.size
+    flag_position = list(FLAG.unpack_from(data, offset))
+    offset += FLAG.size
+
+    if len(data) - offset != width * height:
+        raise MapFormatError(f"{path} should hold {width * height} tiles, not {len(data) - offset}")
+    tiles = memoryview(data)[offset:]
+    return TileMap(width, height, tiles, start_positions, flag_position)
+
+
+def load(path):
+    """ Returns the map in the file at path. The file is mapped in memory, and
+        stays so as long as the map is used.
+    """
+    with open(path, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return loads(data, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Write the maps of maps.py to map files")
+    parser.add_argument("maps", nargs = "+", help = "Names of the maps in maps.py")
+    parser.add_argument("-o", "--output", default = ".", help = "Directory of the files")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok = True)
+    for name in args.maps:
+        current_map = getattr(maps, name, None)
+        if not isinstance(current_map, maps.Map):
+            parser.error(f"Unknown map: {name}")
+        path = os.path.join(args.output, name + EXTENSION)
+        save(current_map, path)
+        print(f"{name}: {current_map.width}x{current_map.height} tiles, {os.path.getsize(path)} bytes -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+""" Generates maps of any size, to see how the game scales with bigger maps
+    and more tanks than the maps of maps.py have.
+
+    A map is generated from a seed: the same arguments always give the same
+    map. The boxes are laid out at random in one part of the map and mirrored
+    to the others (see SYMMETRIES), the tanks start evenly spaced along the
+    edge of the map, facing the flag in the center, and paths are cleared so
+    that every base can reach the flag, going through grass and wooden boxes.
+
+    Example:
+        python mapgen.py 100 100 --tanks 20 --seed 3 -o arena.ctfm
+"""
+import argparse
+import math
+import random
+from collections import deque
+
+import mapfile
+import pathfinding
+
+#-- How the boxes of a map are mirrored:
+#   none        no symmetry
+#   horizontal  the right half mirrors the left half
+#   both        mirrored horizontally and vertically, like the maps of maps.py
+#   rotational  the map looks the same turned by 180 degrees
+SYMMETRIES = ("none", "horizontal", "both", "rotational")
+
+
+def symmetric_tiles(x, y, width, height, symmetry):
+    """ Returns the tiles that have to hold the same box as (x, y). """
+    mirror_x = width - 1 - x
+    mirror_y = height - 1 - y
+    if symmetry == "none":
+        return {(x, y)}
+    if symmetry == "horizontal":
+        return {(x, y), (mirror_x, y)}
+    if symmetry == "both":
+        return {(x, y), (mirror_x, y), (x, mirror_y), (mirror_x, mirror_y)}
+    if symmetry == "rotational":
+        return {(x, y), (mirror_x, mirror_y)}
+    raise ValueError(f"Unknown symmetry: {symmetry}")
+
+
+def edge_tiles(width, height):
+    """ The tiles along the edge of the map, clockwise from the top left corner. """
+    tiles = [(x, 0) for x in range(width)]
+    tiles += [(width - 1, y) for y in range(1, height)]
+    if height > 1:
+        tiles += [(x, height - 1) for x in range(width - 2, -1, -1)]
+    if width > 1:
+        tiles += [(0, y) for y in range(height - 2, 0, -1)]
+    return tiles
+
+
+def start_positions(width, height, n_tanks, flag_position):
+    """ n_tanks start positions evenly spaced along the edge of the map, the tanks facing the flag. """
+    edge = edge_tiles(width, height)
+    if n_tanks > len(edge):
+        raise ValueError(f"A map of {width}x{height} tiles has room for {len(edge)} tanks at most, not {n_tanks}")
+    positions = []
+    for i in range(n_tanks):
+        x, y = edge[(i * len(edge)) // n_tanks]
+        x, y = x + 0.5, y + 0.5
+        # A tank with the orientation a faces (-sin(a), cos(a))
+        orientation = math.degrees(math.atan2(-(flag_position[0] - x), flag_position[1] - y)) % 360
+        positions.append([x, y, round(orientation)])
+    return positions
+
+
+def generate(width, height, seed=0, n_tanks=4, wall_density=0.35, woodbox_ratio=0.3, metalbox_ratio=0.15,
+             symmetry="both"):
+    """ Returns a new map (a mapfile.TileMap) of width x height tiles.
+        wall_density is the share of the tiles that hold a box, woodbox_ratio and
+        metalbox_ratio the share of those boxes that are wooden and metal boxes,
+        the others being rock boxes.
+    """
+    if width < 3 or height < 3:
+        raise ValueError("Maps are at least 3x3 tiles")
+    if woodbox_ratio + metalbox_ratio > 1:
+        raise ValueError("woodbox_ratio + metalbox_ratio can't be more than 1")
+    if symmetry not in SYMMETRIES:
+        raise ValueError(f"Unknown symmetry: {symmetry}")
+
+    rng     = random.Random(seed)
+    grid    = pathfinding.TileGrid(width, height)
+
+    def put(x, y, box_type):
+        for i, j in symmetric_tiles(x, y, width, height, symmetry):
+            grid.tiles[j * width + i] = box_type
+
+    #-- Boxes, drawn in the part of the map that the others mirror
+    region_width = width if symmetry in ("none", "rotational") else (width + 1) // 2
+    region_height = (height + 1) // 2 if symmetry in ("both", "rotational") else height
+    for y in range(region_height):
+        for x in range(region_width):
+            if rng.random() >= wall_density:
+                continue
+            draw = rng.random()
+            if draw < woodbox_ratio:
+                put(x, y, pathfinding.WOODBOX)
+            elif draw < woodbox_ratio + metalbox_ratio:
+                put(x, y, pathfinding.METALBOX)
+            else:
+                put(x, y, pathfinding.ROCKBOX)
+
+    #-- Flag in the center, bases along the edge
+    flag_position = [width / 2, height / 2]
+    flag_tile = (min(int(flag_position[0]), width - 1), min(int(flag_position[1]), height - 1))
+    starts = start_positions(width, height, n_tanks, flag_position)
+    put(*flag_tile, pathfinding.GRASS)
+    for x, y, _ in starts:
+        put(int(x), int(y), pathfinding.GRASS)
+
+    connect(grid, flag_tile, [(int(x), int(y)) for x, y, _ in starts], put)
+
+    return mapfile.TileMap(width, height, bytes(grid.tiles), starts, flag_position)
+
+
+def connect(grid, target, sources, put):
+    """ Clear the boxes that keep the sources (tiles) from reaching the target
+        tile, through the fewest tiles that can't be driven through. put(x, y,
+        box_type) changes a tile (and the tiles that mirror it).
+    """
+    width   = grid.width
+    size    = width * grid.height
+    tiles   = grid.tiles
+    reached = bytearray(size) # Tiles from which the target can be reached
+
+    def passable(index):
+        return pathfinding.PASSABLE[tiles[index]]
+
+    def flood(start):
+        """ Mark the tiles reachable from start as reached. """
+        reached[start] = 1
+        queue = deque([start])
+        while queue:
+            index = queue.popleft()
+            for neighbor in pathfinding.neighbors(index, width, size):
+                if not reached[neighbor] and passable(neighbor):
+                    reached[neighbor] = 1
+                    queue.append(neighbor)
+
+    flood(target[1] * width + target[0])
+    for x, y in sources:
+        source = y * width + x
+        if reached[source]:
+            continue
+
+        # 0-1 breadth first search from the source to any reached tile, blocked tiles cost 1
+        cost = {source: 0}
+        previous = {source: None}
+        queue = deque([source])
+        end = None
+        while queue:
+            index = queue.popleft()
+            if reached[index]:
+                end = index
+                break
+            for neighbor in pathfinding.neighbors(index, width, size):
+                new_cost = cost[index] + (0 if passable(neighbor) else 1)
+                if new_cost < cost.get(neighbor, size + 1):
+                    cost[neighbor] = new_cost
+                    previous[neighbor] = index
+                    if new_cost == cost[index]:
+                        queue.appendleft(neighbor)
+                    else:
+                        queue.append(neighbor)
+
+        # Clear the way, then mark everything the source now reaches
+        index = end
+        while index is not None:
+            if not passable(index):
+                put(index % width, index // width, pathfinding.GRASS)
+            index = previous[index]
+        flood(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Generate a map and write it to a map file")
+    parser.add_argument("width", type = int)
+    parser.add_argument("height", type = int)
+    parser.add_argument("-o", "--output", required = True, help = "Map file to write")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--tanks", type = int, default = 4, help = "Number of start positions")
+    parser.add_argument("--walls", type = float, default = 0.35, help = "Share of the tiles that hold a box")
+    parser.add_argument("--wood", type = float, default = 0.3, help = "Share of the boxes that are wooden boxes")
+    parser.add_argument("--metal", type = float, default = 0.15, help = "Share of the boxes that are metal boxes")
+    parser.add_argument("--symmetry", choices = SYMMETRIES, default = "both")
+    args = parser.parse_args()
+
+    current_map = generate(args.width, args.height, args.seed, args.tanks, args.walls, args.wood, args.metal,
+                           args.symmetry)
+    mapfile.save(current_map, args.output)
+    print(f"{args.output}: {args.width}x{args.height} tiles, {args.tanks} start positions")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,10 @@ class Map:
     """ Return the type of the box at coordinates (x, y). """
     return self.boxes[y][x]
 
+  def tile_bytes(self):
+    """ Return the type of every box, one byte per tile, row after row. """
+    return bytes(box for row in self.boxes for box in row)
+
 
 map0 = Map(9, 9, 
                [ [0, 1, 0, 0, 0, 0, 0, 1, 0], 
@@ -0,0 +1,461 @@
+import heapq
+from array import array
+from collections import deque, OrderedDict
+
+from pymunk import Vec2d
+
+#-- Box types, as used in maps.py
+GRASS       = 0
+ROCKBOX     = 1
+WOODBOX     = 2
+METALBOX    = 3
+
+UNREACHABLE = -1 # Distance of the tiles from which the target can't be reached
+
+FLOW_FIELDS_MEMORY = 32 * 1024 * 1024 # Memory the flow fields of a game may take, in bytes
+
+# Whether each box type can be driven through, without and with metal boxes being passable
+PASSABLE        = (True, False, True, False)
+PASSABLE_METAL  = (True, False, True, True)
+
+
+def neighbors(index, width, size):
+    """ Returns the indices of the tiles above, right of, below and left of the
+        tile at index, in a grid of size tiles and width tiles wide, leaving out
+        the ones outside of the grid.
+    """
+    x = index % width
+    result = []
+    if index >= width:
+        result.append(index - width)
+    if x < width - 1:
+        result.append(index + 1)
+    if index < size - width:
+        result.append(index + width)
+    if x > 0:
+        result.append(index - 1)
+    return result
+
+
+class TileGrid:
+    """ The box type of every tile of a map, in a flat bytearray where the
+        tile (x, y) is at the index y * width + x.
+    """
+
+    def __init__(self, width, height, tiles=None):
+        self.width  = width
+        self.height = height
+        self.tiles  = bytearray(width * height) if tiles is None else bytearray(tiles)
+
+    @classmethod
+    def from_map(cls, current_map):
+        return cls(current_map.width, current_map.height, current_map.tile_bytes())
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def get(self, x, y):
+        """ Return the type of the box at coordinates (x, y), tiles outside of the map are rockboxes. """
+        if not self.in_bounds(x, y):
+            return ROCKBOX
+        return self.tiles[y * self.width + x]
+
+    def set(self, x, y, box_type):
+        self.tiles[y * self.width + x] = box_type
+
+    def neighbors(self, index):
+        """ Returns the indices of the tiles above, right of, below and left of the tile at index. """
+        return neighbors(index, self.width, len(self.tiles))
+
+
+class OccupancyGrid(TileGrid):
+    """ The live state of the tiles of a game: the world keeps it up to date
+        as boxes get destroyed or pushed to other tiles. The version goes up
+        on every change, so that users can cache what they compute from the
+        grid, and the listeners are called with (index, old type, new type).
+    """
+
+    def __init__(self, width, height, tiles=None):
+        super().__init__(width, height, tiles)
+        self.version    = 0
+        self.listeners  = []
+
+    def set(self, x, y, box_type):
+        index = y * self.width + x
+        old_type = self.tiles[index]
+        if old_type == box_type:
+            return
+        self.tiles[index] = box_type
+        self.version += 1
+        for listener in self.listeners:
+            listener(index, old_type, box_type)
+
+
+def is_passable(box_type, metalboxes_passable):
+    """ Grass and wooden boxes (which can be shot) are always passable, metal
+        boxes (which can be pushed) only when metalboxes_passable is True.
+    """
+    return box_type == GRASS or box_type == WOODBOX or (metalboxes_passable and box_type == METALBOX)
+
+
+#-- Status of a PathSearch
+SEARCHING       = "searching"     # The search needs more expansions to finish
+FOUND           = "found"         # The path was found
+NO_PATH         = "no path"       # The target can't be reached
+OUT_OF_BUDGET   = "out of budget" # The search expanded max_expansions tiles without finishing
+
+
+class PathSearch:
+    """ Searches the shortest path from the tile start to the tile target,
+        with a breadth first search, or with A* and a Manhattan distance
+        heuristic if astar is True. Nodes are tile indices and every tile
+        remembers the tile it was reached from.
+        The search can be run a few expansions at a time (for instance a
+        few per tick of the game) and gives up after max_expansions.
+    """
+
+    def __init__(self, grid, start, target, metalboxes_passable, astar=False, max_expansions=None):
+        self.grid           = grid
+        self.passable       = PASSABLE_METAL if metalboxes_passable else PASSABLE
+        self.astar          = astar
+        self.max_expansions = max_expansions
+        self.expansions     = 0    # Number of tiles expanded so far
+        self.path           = None # Indices of the tiles of the path, without the start, once found
+
+        if not (grid.in_bounds(start[0], start[1]) and grid.in_bounds(target[0], target[1])):
+            self.status = NO_PATH
+            return
+
+        self.status         = SEARCHING
+        self.start          = grid.index(start[0], start[1])
+        self.target         = grid.index(target[0], target[1])
+        self.parents        = [-1] * len(grid.tiles)
+        self.parents[self.start] = self.start
+
+        if astar:
+            self.costs = [-1] * len(grid.tiles)
+            self.costs[self.start] = 0
+            self.count = 0 # Breaks ties in the order the tiles were found
+            self.queue = [(0, self.count, self.start)]
+        else:
+            self.queue = deque([self.start])
+
+    def step(self, expansions=None):
+        """ Expand at most that many more tiles (all the ones needed if None)
+            and return the status of the search.
+        """
+        if self.status != SEARCHING:
+            return self.status
+
+        limit = None
+        if expansions is not None:
+            limit = self.expansions + expansions
+        if self.max_expansions is not None and (limit is None or limit > self.max_expansions):
+            limit = self.max_expansions
+
+        if self.astar:
+            found = self.expand_astar(limit)
+        else:
+            found = self.expand_bfs(limit)
+
+        if found:
+            self.status = FOUND
+            self.path = self.rebuild_path()
+        elif not self.queue:
+            self.status = NO_PATH
+        elif self.max_expansions is not None and self.expansions >= self.max_expansions:
+            self.status = OUT_OF_BUDGET
+        return self.status
+
+    def expand_bfs(self, limit):
+        """ Returns True once the target is reached. """
+        width       = self.grid.width
+        tiles       = self.grid.tiles
+        size        = len(tiles)
+        passable    = self.passable
+        parents     = self.parents
+        queue       = self.queue
+        target      = self.target
+        expansions  = self.expansions
+        found       = False
+
+        while queue and (limit is None or expansions < limit):
+            index = queue.popleft()
+            if index == target:
+                found = True
+                break
+            expansions += 1
+            for neighbor in neighbors(index, width, size):
+                if parents[neighbor] == -1 and passable[tiles[neighbor]]:
+                    parents[neighbor] = index
+                    queue.append(neighbor)
+
+        self.expansions = expansions
+        return found
+
+    def expand_astar(self, limit):
+        """ Returns True once the target is reached. """
+        width       = self.grid.width
+        tiles       = self.grid.tiles
+        size        = len(tiles)
+        passable    = self.passable
+        parents     = self.parents
+        costs       = self.costs
+        queue       = self.queue
+        target      = self.target
+        target_x, target_y = target % width, target // width
+        expansions  = self.expansions
+        found       = False
+
+        while queue and (limit is None or expansions < limit):
+            _, _, index = heapq.heappop(queue)
+            if index == target:
+                found = True
+                break
+            expansions += 1
+            cost = costs[index] + 1
+            for neighbor in neighbors(index, width, size):
+                if passable[tiles[neighbor]] and (costs[neighbor] == -1 or cost < costs[neighbor]):
+                    costs[neighbor] = cost
+                    parents[neighbor] = index
+                    self.count += 1
+                    estimate = abs(neighbor % width - target_x) + abs(neighbor // width - target_y)
+                    heapq.heappush(queue, (cost + estimate, self.count, neighbor))
+
+        self.expansions = expansions
+        return found
+
+    def rebuild_path(self):
+        """ Follow the parents back from the target to rebuild the path. """
+        path = []
+        index = self.target
+        while index != self.start:
+            path.append(index)
+            index = self.parents[index]
+        path.reverse()
+        return path
+
+
+def search(grid, start, target, metalboxes_passable, astar=False, max_expansions=None):
+    """ Runs a whole PathSearch. Returns the indices of the tiles of the path,
+        without the start, or None if the target can't be reached (or the
+        search gave up after max_expansions).
+    """
+    path_search = PathSearch(grid, start, target, metalboxes_passable, astar, max_expansions)
+    path_search.step()
+    return path_search.path
+
+
+class FlowField:
+    """ The distance, in number of tiles, from every tile of the grid to the
+        target tile. A tank on any tile finds its next step by moving to the
+        neighbor that is closest to the target.
+        The distances are found by a breadth first search from the target,
+        which can be run a few expansions at a time, like a PathSearch: the
+        field can only be used once it is ready.
+    """
+
+    def __init__(self, grid, target, metalboxes_passable):
+        self.grid                   = grid
+        self.target                 = grid.index(target[0], target[1])
+        self.metalboxes_passable    = metalboxes_passable
+        self.reset()
+
+    def passable(self, index):
+        return is_passable(self.grid.tiles[index], self.metalboxes_passable)
+
+    @property
+    def ready(self):
+        return not self.queue
+
+    def reset(self):
+        """ Start the search from the target over. """
+        self.distances = array("i", [UNREACHABLE]) * len(self.grid.tiles)
+        self.distances[self.target] = 0
+        self.queue = deque([self.target]) if self.passable(self.target) else deque()
+
+    def step(self, expansions=None):
+        """ Expand at most that many more tiles (all the ones needed if None),
+            returns whether the field is ready.
+        """
+        self.propagate(self.queue, expansions)
+        return not self.queue
+
+    def compute(self):
+        """ Breadth first search from the target over the passable tiles, all at once. """
+        self.reset()
+        self.step()
+
+    def propagate(self, queue, expansions=None):
+        """ Lower the distance of the neighbors of the tiles in the queue, and so on,
+            for at most that many tiles of the queue if expansions isn't None.
+            Tiles that can't be entered get a distance (a tank could stand on them)
+            but no path goes through them.
+        """
+        distances = self.distances
+        while queue and expansions != 0:
+            index = queue.popleft()
+            distance = distances[index] + 1
+            for neighbor in self.grid.neighbors(index):
+                if distances[neighbor] == UNREACHABLE or distances[neighbor] > distance:
+                    distances[neighbor] = distance
+                    if self.passable(neighbor):
+                        queue.append(neighbor)
+            if expansions is not None:
+                expansions -= 1
+
+    def tile_opened(self, index):
+        """ A tile became passable: distances can only go down, starting from that tile. """
+        if self.distances[index] == UNREACHABLE:
+            return
+        if self.ready:
+            self.propagate(deque([index]))
+        else:
+            # The search lowers the distances it meets on its way
+            self.queue.append(index)
+
+    def tile_closed(self, index):
+        """ A tile became impassable: only the tiles whose shortest paths all went
+            through it lose their distance, and get a new one from the edge of
+            that region, the rest of the field stays as it is. A search that
+            already went through the tile starts over.
+        """
+        if self.distances[index] == UNREACHABLE:
+            return
+        if index == self.target or not self.ready:
+            self.reset()
+            return
+
+        lost = self.lost_tiles(index)
+        distances = self.distances
+        for tile in lost:
+            distances[tile] = UNREACHABLE
+
+        # Start again from the tiles around the region, closest to the target first
+        queue = []
+        for tile in lost:
+            closest = UNREACHABLE
+            for neighbor in self.grid.neighbors(tile):
+                distance = distances[neighbor]
+                if distance != UNREACHABLE and (closest == UNREACHABLE or distance < closest) and self.passable(neighbor):
+                    closest = distance
+            if closest != UNREACHABLE:
+                distances[tile] = closest + 1
+                queue.append((closest + 1, tile))
+        heapq.heapify(queue)
+        while queue:
+            distance, tile = heapq.heappop(queue)
+            if distance != distances[tile] or not self.passable(tile):
+                continue
+            distance += 1
+            for neighbor in self.grid.neighbors(tile):
+                if distances[neighbor] == UNREACHABLE or distances[neighbor] > distance:
+                    distances[neighbor] = distance
+                    heapq.heappush(queue, (distance, neighbor))
+
+    def lost_tiles(self, index):
+        """ The tiles that only got their distance through the tile at index, which
+            just closed, or through other lost tiles. They are found closest to
+            the target first, so the tiles a tile may get its distance from are
+            known to be lost or not when it is reached.
+        """
+        distances = self.distances
+        lost = set()
+        queue = deque([index])
+        while queue:
+            tile = queue.popleft()
+            distance = distances[tile] + 1
+            for neighbor in self.grid.neighbors(tile):
+                if distances[neighbor] == distance and neighbor not in lost and not self.has_way(neighbor, lost):
+                    lost.add(neighbor)
+                    if self.passable(neighbor):
+                        queue.append(neighbor)
+        return lost
+
+    def has_way(self, index, lost):
+        """ Whether the tile at index has a passable neighbor one step closer to the target that isn't lost. """
+        distance = self.distances[index] - 1
+        for neighbor in self.grid.neighbors(index):
+            if self.distances[neighbor] == distance and neighbor not in lost and self.passable(neighbor):
+                return True
+        return False
+
+    def distance(self, x, y):
+        return self.distances[self.grid.index(x, y)]
+
+    def next_step(self, x, y):
+        """ Returns the tile to move to from the tile (x, y), or None if (x, y)
+            is the target or the target can't be reached from it.
+        """
+        index = self.grid.index(x, y)
+        distance = self.distances[index]
+        if distance <= 0:
+            return None
+        for neighbor in self.grid.neighbors(index):
+            if self.distances[neighbor] == distance - 1 and self.passable(neighbor):
+                return Vec2d(neighbor % self.grid.width, neighbor // self.grid.width)
+        return None
+
+
+class FlowFields:
+    """ Flow fields shared by all the AIs of a game, one per target tile and
+        passability of the metal boxes. Fields are kept up to date as tiles
+        of the occupancy grid change, and the least recently used ones are
+        dropped once there are more than max_fields of them, or once they
+        take more than max_memory bytes (but the last one is always kept).
+    """
+
+    def __init__(self, grid, max_fields=64, max_memory=FLOW_FIELDS_MEMORY):
+        self.grid       = grid
+        field_size      = len(grid.tiles) * array("i").itemsize
+        self.max_fields = max(1, min(max_fields, max_memory // field_size))
+        self.fields     = OrderedDict()
+        grid.listeners.append(self.tile_changed)
+
+    def get(self, target, metalboxes_passable, expansions=None):
+        """ Returns the flow field towards the target tile (x, y), once its search
+            ran at most that many more expansions (all the ones needed if None):
+            it may not be ready yet.
+        """
+        key = (int(target[0]), int(target[1]), metalboxes_passable)
+        field = self.fields.get(key)
+        if field is None:
+            field = FlowField(self.grid, key[:2], metalboxes_passable)
+            self.fields[key] = field
+            if len(self.fields) > self.max_fields:
+                self.fields.popitem(last=False)
+        else:
+            self.fields.move_to_end(key)
+        field.step(expansions)
+        return field
+
+    def tile_changed(self, index, old_type, box_type):
+        """ Update the fields affected by a change of the grid. """
+        for field in self.fields.values():
+            was_passable = is_passable(old_type, field.metalboxes_passable)
+            passable = is_passable(box_type, field.metalboxes_passable)
+            if passable and not was_passable:
+                field.tile_opened(index)
+            elif was_passable and not passable:
+                field.tile_closed(index)
+
+    def next_step(self, start, target, expansions=None):
+        """ Returns the tile to move to from start to get to target, going
+            through metal boxes only if there is no other way. Returns None
+            if the tank is on the target or can't get to it, and SEARCHING if
+            the fields it needs aren't ready yet after at most that many more
+            expansions of their search (see get).
+        """
+        x, y = int(start[0]), int(start[1])
+        if not self.grid.in_bounds(x, y):
+            return None
+        for metalboxes_passable in (False, True):
+            field = self.get(target, metalboxes_passable, expansions)
+            if not field.ready:
+                return SEARCHING
+            if field.distance(x, y) != UNREACHABLE:
+                return field.next_step(x, y)
+        return None
@@ -0,0 +1,99 @@
+import pygame
+
+import images
+
+
+def make_background(current_map):
+    """ Returns a surface of the size of the map, covered with grass. """
+    background = pygame.Surface(current_map.rect().size)
+
+    #-- Copy the grass tile all over the level area
+    for x in range(0, current_map.width):
+        for y in range(0,  current_map.height):
+            # The call to the function "blit" will copy the image
+            # contained in "images.grass" into the "background"
+            # image at the coordinates given as the second argument
+            background.blit(images.grass,  (x*images.TILE_SIZE, y*images.TILE_SIZE))
+
+    return background
+
+
+class StaticLayer:
+    """ The background with all the static objects of the game (rock boxes,
+        bases...) drawn on it. It is only redrawn when the world reports that
+        its static objects have changed.
+    """
+
+    def __init__(self, game, background):
+        self.game       = game
+        self.background = background
+        self.surface    = None
+        self.version    = None # static_version of the world when the layer was drawn
+
+    def get_surface(self):
+        """ Returns the layer, redrawing it first if it is out of date. """
+        if self.version != self.game.static_version:
+            self.surface = self.background.copy()
+            for obj in self.game.static_objects:
+                obj.update_screen(self.surface)
+            self.version = self.game.static_version
+        return self.surface
+
+
+class Renderer:
+    """ Draws the game on the screen: the static layer, and on top of it
+        every object of the game that can move or change.
+    """
+
+    def __init__(self, game, background):
+        self.game           = game
+        self.static_layer   = StaticLayer(game, background)
+
+    def draw(self, screen):
+        screen.blit(self.static_layer.get_surface(), (0, 0))
+
+        # Update the display of the game objects on the screen
+        for obj in self.game.drawable_objects():
+            obj.update_screen(screen)
+
+    def update_display(self):
+        """ Redisplay the entire screen (see double buffer technique). """
+        pygame.display.flip()
+
+
+class DirtyRectRenderer(Renderer):
+    """ A renderer that only repaints the parts of the screen that changed:
+        the areas covered by the objects on the previous frame are restored
+        from the static layer, the objects are drawn again, and only those
+        areas are sent to the display.
+    """
+
+    def __init__(self, game, background):
+        super().__init__(game, background)
+        self.previous_rects = [] # Areas drawn on during the previous frame
+        self.dirty_rects    = [] # Areas to send to the display for this frame
+        self.version        = None # static_version of the layer on the screen
+
+    def draw(self, screen):
+        layer = self.static_layer.get_surface()
+
+        # The whole screen has to be repainted the first time, and whenever the static layer changed
+        if self.version != self.static_layer.version:
+            screen.blit(layer, (0, 0))
+            self.version = self.static_layer.version
+            self.dirty_rects = [screen.get_rect()]
+        else:
+            for rect in self.previous_rects:
+                screen.blit(layer, rect, rect)
+            self.dirty_rects = list(self.previous_rects)
+
+        self.previous_rects = []
+        for obj in self.game.drawable_objects():
+            rect = obj.update_screen(screen)
+            if rect:
+                self.previous_rects.append(rect)
+        self.dirty_rects += self.previous_rects
+
+    def update_display(self):
+        """ Only send the areas that changed to the display. """
+        pygame.display.update(self.dirty_rects)
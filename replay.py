@@ -0,0 +1,300 @@
+""" Records the commands given to every tank of a game, and plays them back
+    headless, as fast as the CPU allows.
+
+    A game only depends on its map and on the commands given to the tanks on
+    every tick (see the CONTROL_* bits in gameobjects.py), so a replay is the
+    map, the seed of the game and one byte per tank and tick. Every
+    HASH_INTERVAL ticks a hash of the state of the game is stored too, so that
+    the playback can tell when it doesn't play the same game (a desync).
+
+    File format: a header (see HEADER), the map (as in a map file, see
+    mapfile.py, so that any map can be replayed, generated ones too), one byte
+    per tank telling whether a player drove it, then zlib compressed records:
+    - for every tick: the index of the first AI in line that tick (see
+      ai.AiScheduler) and the CONTROL_* bits of every tank
+    - after the ticks that are a multiple of the hash interval: the hash of
+      the state of the game, as a 32 bits integer
+
+    Example:
+        python replay.py game.ctfr --seek 3000 --check
+"""
+import argparse
+from array import array
+import struct
+import time
+import zlib
+
+import world
+import mapfile
+import snapshot
+
+MAGIC           = b"CTFR"
+VERSION         = 2
+HEADER          = struct.Struct("<4sBqBHI") # Magic, version, seed, number of tanks, hash interval, length of the map
+HASH            = struct.Struct("<I")
+HASH_INTERVAL   = 50 # Ticks between two hashes of the state of the game, 0 for none
+SNAPSHOT_INTERVAL = 500 # Least number of ticks between two snapshots taken by a Player, to seek back
+SNAPSHOT_CAPACITY = 64  # Snapshots kept by a Player: longer replays get a longer interval between them
+
+
+class ReplayError(Exception):
+    """ The file isn't a replay this version can play. """
+
+
+class Desync(Exception):
+    """ Raised by a Player checking the hashes when the game it plays back isn't the recorded one. """
+
+
+def state_hash(game):
+    """ A hash of the state of the game: the tanks, the flag, the scores and the live bullets. """
+    values = [game.ticks, game.flag.x, game.flag.y]
+    for tank in game.tanks_list:
+        values += [*tank.body.position, tank.body.angle, *tank.body.velocity, tank.body.angular_velocity,
+                   tank.healthpoints, tank.shot_cooldown, tank.scoreboard.current_score]
+    for bullet in game.bullets.live:
+        values += bullet.body.position
+    return zlib.crc32(struct.pack(f"<{len(values)}d", *values))
+
+
+class Recorder:
+    """ Writes the commands given to the tanks of a game to a file, from the
+        moment it is created until it is closed.
+    """
+
+    def __init__(self, path, game, hash_interval=HASH_INTERVAL):
+        if game.ticks != 0:
+            raise ValueError("Games have to be recorded from their first tick")
+        self.game           = game
+        self.hash_interval  = hash_interval
+        self.n_tanks        = len(game.tanks_list)
+        self.file           = open(path, "wb")
+        self.compressor     = zlib.compressobj(9)
+        self.ticks          = 0
+
+        map_data = mapfile.dumps(game.current_map)
+        seed = -1 if game.seed is None else game.seed
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, self.n_tanks, hash_interval, len(map_data)))
+        self.file.write(map_data)
+        self.file.write(bytes(tank in game.players for tank in game.tanks_list))
+
+        game.recorder = self
+
+    def record_tick(self, game, first_ai):
+        """ Called by the world once the tanks were given their commands of the tick. """
+        record = bytes([first_ai] + [tank.controls for tank in game.tanks_list])
+        if self.hash_interval and game.ticks % self.hash_interval == 0:
+            record += HASH.pack(state_hash(game))
+        self.file.write(self.compressor.compress(record))
+        self.ticks += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.game.recorder = None
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+
+class ReplayWorld(world.World):
+    """ A world where the tanks get the recorded commands instead of the ones
+        of the players and the AIs.
+    """
+
+    def __init__(self, current_map, driven_by_player, controls, seed=None):
+        """ driven_by_player tells for every tank whether a player drove it, controls
+            is the list of the (first AI, commands of every tank) of every tick,
+            seed the one of the recorded game.
+        """
+        super().__init__(current_map, [None] * len(driven_by_player), seed)
+        # The flag is grabbed on their own by the tanks of the players only
+        self.players    = [tank for tank, player in zip(self.tanks_list, driven_by_player) if player]
+        self.player_ids = [i for i, player in enumerate(driven_by_player) if player]
+        self.ai_ids     = [i for i, player in enumerate(driven_by_player) if not player]
+        self.controls   = controls
+        self.checks     = {} # Hash of the state expected at some ticks
+
+    def decide(self):
+        """ Give the tanks their recorded commands, in the order they got them. """
+        for tank in self.tanks_list:
+            tank.controls = 0
+
+        first_ai, tank_controls = self.controls[self.ticks]
+        for i in self.player_ids:
+            self.apply_controls(self.tanks_list[i], tank_controls[i])
+        for n in range(len(self.ai_ids)):
+            i = self.ai_ids[(first_ai + n) % len(self.ai_ids)]
+            self.apply_controls(self.tanks_list[i], tank_controls[i])
+
+        expected = self.checks.get(self.ticks)
+        if expected is not None and expected != state_hash(self):
+            raise Desync(f"The replay doesn't play the recorded game from tick {self.ticks}")
+
+
+class Player:
+    """ Plays a replay back headless. The game can be moved forward by any number
+        of ticks, or to any tick.
+        With check, the state of the game is compared to the recorded hashes.
+
+        The first time a tick is played, the hash of the state of the game is
+        kept, and a snapshot of the game is taken every snapshot_interval ticks
+        (see snapshot.py). By default the interval is a multiple of the hash
+        interval, long enough for SNAPSHOT_CAPACITY snapshots to cover the whole
+        replay. Going back to a tick restores the latest snapshot before it into
+        a second world, unless exact is given to seek, and plays it up to the
+        tick. The physics engine remembers things a snapshot can't hold, so a
+        restored game often drifts apart from the recorded one: it is compared
+        to the kept hashes on every tick, and on the first mismatch the game is
+        played again from the start instead. Going forward past the ticks played
+        so far goes on with the game that was never restored.
+    """
+
+    def __init__(self, path, check=True, snapshot_interval=None):
+        with open(path, "rb") as file:
+            data = file.read()
+
+        magic, version, seed, n_tanks, self.hash_interval, map_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ReplayError(f"{path} isn't a replay of version {VERSION}")
+        self.seed = None if seed == -1 else seed
+        offset = HEADER.size
+        self.current_map = mapfile.loads(data[offset:offset + map_length], path)
+        offset += map_length
+        self.driven_by_player = [bool(player) for player in data[offset:offset + n_tanks]]
+        offset += n_tanks
+
+        self.controls, self.hashes = self.parse(zlib.decompress(data[offset:]), n_tanks)
+        self.check = check
+        if snapshot_interval is None:
+            snapshot_interval = self.default_snapshot_interval()
+        self.snapshot_interval = snapshot_interval
+        self.snapshots = snapshot.SnapshotRing(SNAPSHOT_CAPACITY)
+        self.tick_hashes = array("I") # Hash of the state of the game at the beginning of every tick played so far
+        self.first = self.new_game()  # The game played from the start, never restored
+        self.game = self.first
+        self.restored = False         # Whether the game was restored from a snapshot, and may drift
+
+    def parse(self, records, n_tanks):
+        """ Returns the (first AI, commands of the tanks) of every tick, and the hashes by tick. """
+        controls = []
+        hashes = {}
+        offset = 0
+        while offset < len(records):
+            tick = len(controls)
+            controls.append((records[offset], records[offset + 1:offset + 1 + n_tanks]))
+            offset += 1 + n_tanks
+            if self.hash_interval and tick % self.hash_interval == 0:
+                hashes[tick] = HASH.unpack_from(records, offset)[0]
+                offset += HASH.size
+        return controls, hashes
+
+    def default_snapshot_interval(self):
+        interval = max(SNAPSHOT_INTERVAL, -(-self.length // SNAPSHOT_CAPACITY))
+        if self.hash_interval:
+            interval = -(-interval // self.hash_interval) * self.hash_interval
+        return interval
+
+    @property
+    def length(self):
+        """ Number of ticks of the replay. """
+        return len(self.controls)
+
+    @property
+    def ticks(self):
+        return self.game.ticks
+
+    def new_game(self):
+        """ Returns the game at its first tick. """
+        game = ReplayWorld(self.current_map, self.driven_by_player, self.controls, self.seed)
+        if self.check:
+            game.checks = self.hashes
+        return game
+
+    def restart(self):
+        """ Start the game over. """
+        self.game = self.new_game()
+        self.restored = False
+
+    def fast_forward(self, n_ticks):
+        """ Play the next n_ticks ticks (fewer at the end of the replay), returns the number played. """
+        n_ticks = max(0, min(n_ticks, self.length - self.game.ticks))
+        self.seek(self.game.ticks + n_ticks)
+        return n_ticks
+
+    def play_first(self, end):
+        """ Play the game that was never restored up to the tick end, keeping the hashes and the snapshots. """
+        game = self.first
+        while game.ticks < end:
+            if self.snapshot_interval:
+                if game.ticks % self.snapshot_interval == 0:
+                    self.snapshots.add(snapshot.take(game))
+                self.tick_hashes.append(state_hash(game))
+            game.tick()
+
+    def play_restored(self, end):
+        """ Play the restored game up to the tick end, before the ticks played by the
+            first game. Returns whether its state matched the kept hashes on every tick.
+        """
+        game = self.game
+        while state_hash(game) == self.tick_hashes[game.ticks]:
+            if game.ticks == end:
+                return True
+            game.tick()
+        return False
+
+    def seek(self, tick, exact=False):
+        """ Move the game to the given tick. """
+        tick = max(0, min(tick, self.length))
+        if tick >= self.first.ticks:
+            self.play_first(tick)
+            self.game = self.first
+            self.restored = False
+            return
+
+        if self.game is not self.first and self.game.ticks <= tick and not (exact and self.restored):
+            # Go on with the game of the last seek back
+            if not self.restored:
+                self.game.step(tick - self.game.ticks)
+                return
+            if self.play_restored(tick):
+                return
+        else:
+            latest = None if exact else self.snapshots.latest(tick)
+            if latest is not None:
+                game = self.new_game() if self.game is self.first else self.game
+                game.checks = {}
+                snapshot.restore(game, latest)
+                self.game = game
+                self.restored = True
+                if self.play_restored(tick):
+                    return
+
+        # The restored game drifted apart from the recorded one: play it from the start
+        self.restart()
+        self.game.step(tick)
+
+    def play(self):
+        """ Play the whole replay. """
+        self.seek(self.length)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Play a recorded game back, headless")
+    parser.add_argument("path", help = "Replay file, recorded with ctf.py --record")
+    parser.add_argument("--seek", type = int, help = "Stop at this tick instead of the end")
+    parser.add_argument("--check", action = "store_true", help = "Check the recorded hashes of the state of the game")
+    args = parser.parse_args()
+
+    world.setup_headless()
+    start = time.perf_counter()
+    player = Player(args.path, args.check)
+    player.seek(player.length if args.seek is None else args.seek)
+    elapsed = time.perf_counter() - start
+
+    print(f"{player.current_map.width}x{player.current_map.height} map: {player.ticks} of {player.length} ticks in {elapsed:.2f} s "
+          f"({player.ticks / elapsed:.0f} ticks/s)")
+    for tick, i in player.game.captures:
+        print(f"Tick {tick}: tank {i+1} captured the flag")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+""" Snapshots of the state of a world, to go back to it later: seeking in
+    replays without playing them from the start, or rolling a game back.
+
+    A snapshot holds the state of the game in a few flat arrays (floats, then
+    integers), in a fixed order: the tanks, the flag, the boxes that can move
+    or be destroyed, the bullets and the explosions. It can only be restored
+    into the world it was taken from.
+
+    Not part of a snapshot: the state of the AIs (their generators), which is
+    why snapshots are meant for games whose tanks are driven by commands (see
+    replay.py), and what the physics engine carries from one step to the next
+    (the contacts it remembers, the corrections of overlapping shapes) and
+    that pymunk can't read nor set: a game continued from a snapshot usually
+    drifts apart from the one that was saved within a few ticks, as soon as
+    objects touch. Whoever restores a snapshot has to check the game it gets
+    (replay.Player compares it to the hashes of the game it was taken from).
+"""
+from array import array
+from collections import OrderedDict
+
+import pymunk
+
+import gameobjects
+import images
+
+
+class Snapshot:
+    """ The state of a world at the beginning of a tick. """
+
+    def __init__(self, ticks, floats, ints, tiles, captures):
+        self.ticks      = ticks
+        self.floats     = floats   # array("d")
+        self.ints       = ints     # array("q")
+        self.tiles      = tiles    # bytes of the occupancy grid
+        self.captures   = captures # Flag captures until then
+
+    def size(self):
+        """ Size of the arrays of the snapshot, in bytes. """
+        return (len(self.floats) * self.floats.itemsize + len(self.ints) * self.ints.itemsize
+                + len(self.tiles) + 16 * len(self.captures))
+
+
+def take(game):
+    """ Returns a snapshot of the game, between two ticks. """
+    floats = array("d")
+    ints = array("q", [game.ticks, game.ai_scheduler.first])
+    ints.extend(game.kills)
+    ints.extend(game.deaths)
+
+    #-- Tanks
+    for tank in game.tanks_list:
+        body = tank.body
+        floats.extend((body.position.x, body.position.y, body.angle, body.velocity.x, body.velocity.y,
+                       body.angular_velocity, tank.max_speed, tank.healthpoints))
+        ints.extend((tank.acceleration, tank.rotation, tank.lasthit,
+                     tank.respawn_shield_timer, tank.shot_cooldown, tank.scoreboard.current_score,
+                     tank.flag is not None, game.player_controls.get(tank, 0)))
+
+    #-- Flag
+    floats.extend((game.flag.x, game.flag.y, game.flag.orientation))
+
+    #-- Boxes
+    for box in game.boxes:
+        body = box.body
+        floats.extend((body.position.x, body.position.y, body.angle, body.velocity.x, body.velocity.y,
+                       body.angular_velocity))
+        x, y = game.box_tiles.get(box, (-1, -1))
+        ints.extend((box.alive, x, y, box in game.moving_boxes))
+
+    #-- Bullets
+    ints.append(len(game.bullets.live))
+    for bullet in game.bullets.live:
+        body = bullet.body
+        floats.extend((body.position.x, body.position.y, body.angle, body.velocity.x, body.velocity.y,
+                       body.angular_velocity, bullet.orientation, bullet.start_position.x, bullet.start_position.y))
+        ints.extend((bullet.lifetime, game.tanks_list.index(bullet.shooter)))
+
+    #-- Explosions
+    explosions = list(game.game_objects_list.of_type(gameobjects.Explosion))
+    ints.append(len(explosions))
+    for explosion in explosions:
+        floats.extend((explosion.x, explosion.y))
+        ints.append(explosion.explosion_timer)
+
+    return Snapshot(game.ticks, floats, ints, bytes(game.occupancy.tiles), list(game.captures))
+
+
+def restore(game, snapshot):
+    """ Put the game back in the state of the snapshot. """
+    floats = iter(snapshot.floats)
+    ints = iter(snapshot.ints)
+
+    game.ticks = next(ints)
+    game.ai_scheduler.first = next(ints)
+    game.kills[:] = [next(ints) for _ in game.kills]
+    game.deaths[:] = [next(ints) for _ in game.deaths]
+    game.captures[:] = snapshot.captures
+
+    #-- Tanks
+    flag = game.flag
+    flag.is_on_tank = False
+    for tank in game.tanks_list:
+        body = tank.body
+        body.position = next(floats), next(floats)
+        body.angle = next(floats)
+        body.velocity = next(floats), next(floats)
+        body.angular_velocity = next(floats)
+        tank.max_speed = next(floats)
+        tank.healthpoints = next(floats)
+
+        tank.acceleration = next(ints)
+        tank.rotation = next(ints)
+        tank.lasthit = next(ints)
+        tank.respawn_shield_timer = next(ints)
+        tank.shot_cooldown = next(ints)
+        tank.scoreboard.current_score = next(ints)
+        tank.scoreboard.show_score = images.new_scoreboard[min(tank.scoreboard.current_score, len(images.new_scoreboard) - 1)]
+        tank.scoreboard.sprite = tank.scoreboard.show_score
+        tank.flag = flag if next(ints) else None
+        if tank.flag is not None:
+            flag.is_on_tank = True
+        controls = next(ints)
+        if tank in game.players:
+            game.player_controls[tank] = controls
+
+    #-- Flag
+    flag.x, flag.y, flag.orientation = next(floats), next(floats), next(floats)
+
+    #-- Boxes
+    game.moving_boxes.clear()
+    for box in game.boxes:
+        position = next(floats), next(floats)
+        angle = next(floats)
+        velocity = next(floats), next(floats)
+        angular_velocity = next(floats)
+        alive, x, y, moving = next(ints), next(ints), next(ints), next(ints)
+
+        if alive and not box.alive:
+            # Destroyed since the snapshot
+            box.alive = True
+            game.space.add(box.body, box.shape)
+            game.game_objects_list.append(box)
+        elif box.alive and not alive:
+            # Destroyed after the snapshot was taken
+            box.despawn()
+            game.space.remove(box.body, box.shape)
+            game.game_objects_list.discard(box)
+
+        box.body.position = position
+        box.body.angle = angle
+        box.body.velocity = velocity
+        box.body.angular_velocity = angular_velocity
+        if alive:
+            game.box_tiles[box] = (x, y)
+            if moving:
+                game.moving_boxes[box] = True
+        else:
+            game.box_tiles.pop(box, None)
+
+    #-- Bullets
+    for bullet in list(game.bullets.live):
+        game.bullets.release(bullet)
+    for _ in range(next(ints)):
+        position = next(floats), next(floats)
+        angle = next(floats)
+        velocity = next(floats), next(floats)
+        angular_velocity = next(floats)
+        orientation = next(floats)
+        start_position = next(floats), next(floats)
+        lifetime, shooter = next(ints), next(ints)
+
+        bullet = game.bullets.acquire(game.tanks_list[shooter])
+        bullet.body.position = position
+        bullet.body.angle = angle
+        bullet.body.velocity = velocity
+        bullet.body.angular_velocity = angular_velocity
+        bullet.orientation = orientation
+        bullet.start_position = pymunk.Vec2d(start_position)
+        bullet.lifetime = lifetime
+
+    #-- Explosions
+    for explosion in list(game.game_objects_list.of_type(gameobjects.Explosion)):
+        game.despawn(explosion)
+    game.despawn_dead_objects()
+    for _ in range(next(ints)):
+        explosion = game.spawn(gameobjects.Explosion, next(floats), next(floats))
+        explosion.explosion_timer = next(ints)
+
+    #-- Tiles: what the AIs computed from them is out of date
+    game.occupancy.tiles[:] = snapshot.tiles
+    game.occupancy.version += 1
+    game.flow_fields.fields.clear()
+    game.targeting.cache.clear()
+
+
+class SnapshotRing:
+    """ The last capacity snapshots of a game, by tick. """
+
+    def __init__(self, capacity=64):
+        self.capacity   = capacity
+        self.snapshots  = OrderedDict()
+
+    def add(self, snapshot):
+        self.snapshots[snapshot.ticks] = snapshot
+        self.snapshots.move_to_end(snapshot.ticks)
+        while len(self.snapshots) > self.capacity:
+            self.snapshots.popitem(last=False)
+
+    def latest(self, tick):
+        """ Returns the snapshot of the latest tick not after tick, or None. """
+        best = None
+        for snapshot in self.snapshots.values():
+            if snapshot.ticks <= tick and (best is None or snapshot.ticks > best.ticks):
+                best = snapshot
+        return best
+
+    def clear(self):
+        self.snapshots.clear()
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def __contains__(self, tick):
+        return tick in self.snapshots
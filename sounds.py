@@ -0,0 +1,102 @@
+""" The sound effects of the game, decoded once and played through a fixed
+    pool of mixer channels.
+
+    Every sound may only play on a few channels at a time (its voices): when
+    a sound already plays on all of them, the voice that started first is cut
+    to play the sound again, so that a burst of shots can't take all the
+    channels from the explosions.
+"""
+import pygame
+
+import assets
+
+#-- Files of the sound effects, in the Music directory
+SOUNDS = {
+    "shoot":        "shoot_1.wav",
+    "explosion":    "explosion.wav",
+    "win":          "win_sound.wav",
+}
+
+#-- Number of channels each sound may play on at the same time
+VOICES = {
+    "shoot":        4,
+    "explosion":    3,
+    "win":          1,
+}
+
+
+class SoundBank:
+    """ Plays the sound effects on n_channels channels of the mixer. Nothing is
+        loaded and the mixer isn't touched until a sound is first played (or
+        preloaded), and never when the bank is disabled.
+    """
+
+    def __init__(self, sounds=SOUNDS, voices=VOICES, n_channels=8):
+        self.files      = dict(sounds)
+        self.voices     = dict(voices)
+        self.n_channels = n_channels
+        self.enabled    = True
+        self.sounds     = {}   # Decoded sounds by name
+        self.channels   = None # The pool of channels, created with the first sound
+        self.playing    = {}   # Channels every sound was last started on, oldest first
+
+    def load(self, name):
+        """ Returns the sound called name, decoding it the first time. """
+        sound = self.sounds.get(name)
+        if sound is None:
+            sound = self.sounds[name] = assets.sound(self.files[name])
+        return sound
+
+    def preload(self):
+        """ Decode all the sounds now, rather than when they are first played. """
+        if self.enabled:
+            for name in self.files:
+                self.load(name)
+
+    def get_channels(self):
+        if self.channels is None:
+            if pygame.mixer.get_init() is None:
+                pygame.mixer.init()
+            if pygame.mixer.get_num_channels() < self.n_channels:
+                pygame.mixer.set_num_channels(self.n_channels)
+            self.channels = [pygame.mixer.Channel(i) for i in range(self.n_channels)]
+        return self.channels
+
+    def play(self, name):
+        """ Play the sound called name. Returns the channel it plays on, or None
+            if it isn't played.
+        """
+        if not self.enabled:
+            return None
+        sound = self.load(name)
+        if isinstance(sound, assets.NullSound):
+            return None
+
+        # The channels that still play this sound
+        voices = [channel for channel in self.playing.get(name, ()) if channel.get_sound() is sound]
+        if len(voices) >= self.voices.get(name, 1):
+            channel = voices.pop(0) # Cut the oldest voice
+        else:
+            channel = next((channel for channel in self.get_channels() if not channel.get_busy()), None)
+            if channel is None:
+                self.playing[name] = voices
+                return None
+        channel.play(sound)
+        voices.append(channel)
+        self.playing[name] = voices
+        return channel
+
+    def stop(self):
+        """ Stop all the sounds of the bank. """
+        for channel in self.channels or ():
+            channel.stop()
+        self.playing.clear()
+
+
+#-- The sound bank of the game
+bank = SoundBank()
+
+
+def play(name):
+    """ Play the sound effect called name with the sound bank of the game. """
+    return bank.play(name)
@@ -0,0 +1,127 @@
+import math
+
+import pymunk
+
+import pathfinding
+
+
+#-- Distance from the center of a tank to the front, where its bullets appear
+MUZZLE_DISTANCE = 0.3
+
+#-- How close to a ray the center of a tank has to be for the ray to possibly hit it
+TANK_MARGIN     = 0.75
+
+MOVABLE_BOXES   = (pathfinding.WOODBOX, pathfinding.METALBOX)
+
+
+def cast_ray(grid, start, direction, max_distance):
+    """ Walks the tiles of grid crossed by the ray from start in direction (a unit
+        vector), one tile at a time (a DDA, as in Amanatides and Woo), until the
+        first rock box or the edge of the grid.
+        Returns the distance along the ray to that tile (at most max_distance),
+        and whether the ray may hit a wooden or metal box before it. Those boxes
+        can be pushed half a tile or so off the tile they are on in the grid,
+        so the tiles around the ray are checked too.
+    """
+    x, y        = start
+    dx, dy      = direction
+    tile_x      = math.floor(x)
+    tile_y      = math.floor(y)
+    step_x      = 1 if dx > 0 else -1
+    step_y      = 1 if dy > 0 else -1
+
+    # Distance along the ray to the next vertical and horizontal tile edges, and between two of them
+    next_x      = ((tile_x + (dx > 0) - x) / dx) if dx != 0 else math.inf
+    next_y      = ((tile_y + (dy > 0) - y) / dy) if dy != 0 else math.inf
+    delta_x     = abs(1 / dx) if dx != 0 else math.inf
+    delta_y     = abs(1 / dy) if dy != 0 else math.inf
+
+    distance    = 0.0
+    crosses_box = False
+    while distance < max_distance:
+        box_type = grid.get(tile_x, tile_y)
+        if box_type == pathfinding.ROCKBOX:
+            return distance, crosses_box
+        if not crosses_box:
+            crosses_box = any(grid.get(i, j) in MOVABLE_BOXES
+                              for i in (tile_x - 1, tile_x, tile_x + 1)
+                              for j in (tile_y - 1, tile_y, tile_y + 1))
+
+        if next_x < next_y:
+            distance = next_x
+            next_x += delta_x
+            tile_x += step_x
+        else:
+            distance = next_y
+            next_y += delta_y
+            tile_y += step_y
+
+    return max_distance, crosses_box
+
+
+class Targeting:
+    """ Finds what the AI tanks are aiming at, for as little raycasting in the
+        physics engine as possible:
+        - tanks that can't shoot (shot_cooldown > 0) don't look
+        - the ray stops at the map diagonal, and at the first rock box on the
+          occupancy grid, walked tile by tile before asking the physics engine
+        - if the tiles in front of the tank hold no box and no other tank is
+          close to the ray, the physics engine isn't asked at all
+        - the result is kept for CACHE_TICKS ticks
+    """
+
+    CACHE_TICKS = 5 # Number of ticks a tank keeps aiming at what it found
+
+    def __init__(self, space, grid, tanks_list):
+        self.space          = space
+        self.grid           = grid
+        self.tanks_list     = tanks_list
+        self.max_distance   = math.hypot(grid.width, grid.height)
+        self.cache          = {} # tank -> [target, number of ticks the target is still valid]
+        self.raycasts       = 0  # Number of queries sent to the physics engine
+
+    def target(self, tank):
+        """ Returns the object (a tank or a box) in front of the tank, or None.
+            Meant to be called once per tick for every tank.
+        """
+        if tank.shot_cooldown > 0:
+            self.cache.pop(tank, None)
+            return None
+
+        cached = self.cache.get(tank)
+        if cached is not None and cached[1] > 0:
+            cached[1] -= 1
+            return cached[0]
+
+        target = self.find_target(tank)
+        self.cache[tank] = [target, self.CACHE_TICKS - 1]
+        return target
+
+    def find_target(self, tank):
+        x, y        = tank.body.position
+        angle       = tank.body.angle
+
+        # Same direction and starting point as the bullets of the tank
+        direction   = pymunk.Vec2d(-math.sin(angle), math.cos(angle))
+        start       = pymunk.Vec2d(x, y) + direction * MUZZLE_DISTANCE
+
+        distance, crosses_box = cast_ray(self.grid, start, direction, self.max_distance)
+        if not crosses_box and not self.tank_near_ray(tank, start, direction, distance):
+            return None
+
+        self.raycasts += 1
+        ray = self.space.segment_query_first(start, start + direction * distance, 0, pymunk.ShapeFilter())
+        if ray is None:
+            return None
+        return ray.shape.parent
+
+    def tank_near_ray(self, tank, start, direction, distance):
+        """ Whether a tank other than tank may be hit by the ray before distance. """
+        for other in self.tanks_list:
+            if other is tank:
+                continue
+            offset = other.body.position - start
+            along = offset.dot(direction)
+            if -TANK_MARGIN <= along <= distance + TANK_MARGIN and abs(offset.cross(direction)) <= TANK_MARGIN:
+                return True
+        return False
@@ -0,0 +1,213 @@
+""" Plays many headless AI-vs-AI matches in parallel and reports the results.
+
+    Example:
+        python tournament.py -n 1000 --maps map0 map1 map2 --ticks 5000 --json report.json --csv report.csv
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+import time
+
+import world
+import ai
+import mapfile
+import maps
+
+
+def make_matches(n_matches, map_names, ticks, roster_names=None, seed=0):
+    """ Returns the description of n_matches matches, cycling through the maps.
+        Every match gets its own seed, derived from the tournament seed.
+        Without a roster every start position of the map is played by an Ai.
+    """
+    matches = []
+    for i in range(n_matches):
+        map_name = map_names[i % len(map_names)]
+        if roster_names is None:
+            roster = ["Ai"] * len(get_map(map_name).start_positions)
+        else:
+            roster = list(roster_names)
+        matches.append({
+            "match": i,
+            "seed": seed + i,
+            "map": map_name,
+            "ticks": ticks,
+            "roster": roster,
+            })
+    return matches
+
+
+def get_map(map_name):
+    """ Returns the map called map_name in maps.py, or the map in the file
+        map_name if it ends with mapfile.EXTENSION.
+    """
+    if map_name.endswith(mapfile.EXTENSION):
+        return mapfile.load(map_name)
+    current_map = getattr(maps, map_name, None)
+    if not isinstance(current_map, maps.Map):
+        raise ValueError(f"Unknown map: {map_name}")
+    return current_map
+
+
+def get_ai_class(ai_name):
+    """ Returns the Ai class called ai_name in ai.py. """
+    ai_class = getattr(ai, ai_name, None)
+    if not (isinstance(ai_class, type) and issubclass(ai_class, ai.Ai)):
+        raise ValueError(f"Unknown AI: {ai_name}")
+    return ai_class
+
+
+def play_match(match):
+    """ Plays a single match headless and returns its results. """
+    world.setup_headless()
+
+    current_map = get_map(match["map"])
+    if len(match["roster"]) > len(current_map.start_positions):
+        raise ValueError(f"{match['map']} only has {len(current_map.start_positions)} start positions")
+    roster = [get_ai_class(name) for name in match["roster"]]
+
+    # Building the world (map, physics and AIs) is timed apart, so that ticks_per_second is the speed of the simulation only
+    start = time.perf_counter()
+    game = world.World(current_map, roster, match["seed"])
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    game.step(match["ticks"])
+    elapsed = time.perf_counter() - start
+
+    captures = [0] * len(game.tanks_list)
+    for tick, i in game.captures:
+        captures[i] += 1
+
+    result = dict(match)
+    result.update({
+        "captures": captures,
+        "first_capture_tick": game.captures[0][0] if game.captures else None,
+        "kills": list(game.kills),
+        "deaths": list(game.deaths),
+        "setup_seconds": setup,
+        "seconds": elapsed,
+        "ticks_per_second": match["ticks"] / elapsed,
+        })
+    return result
+
+
+def run_tournament(matches, processes=None):
+    """ Plays all the matches on a pool of processes (one per CPU core by default)
+        and returns the results in the order of the matches.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    # Hand out the matches in a few chunks per worker, so that fast and slow maps even out
+    chunksize = max(1, len(matches) // (4 * processes))
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(play_match, matches, chunksize)
+    finally:
+        # Let the workers exit by themselves: SDL catches the SIGTERM that
+        # Pool.terminate() would send, which leaves the pool waiting forever.
+        pool.close()
+        pool.join()
+    return results
+
+
+def summarize(results, elapsed):
+    """ Aggregates the match results per map and per AI. """
+    summary = {
+        "matches": len(results),
+        "seconds": elapsed,
+        "ticks": sum(result["ticks"] for result in results),
+        "matches_per_minute": 60 * len(results) / elapsed if elapsed else None,
+        "ticks_per_second": sum(result["ticks"] for result in results) / elapsed if elapsed else None,
+        "maps": {},
+        "ais": {},
+        }
+
+    for result in results:
+        map_summary = summary["maps"].setdefault(result["map"], {"matches": 0, "captures": 0, "first_capture_ticks": [],
+                                                                  "outcomes": set()})
+        map_summary["matches"] += 1
+        map_summary["outcomes"].add((tuple(result["roster"]), tuple(result["captures"]), tuple(result["kills"]),
+                                     tuple(result["deaths"]), result["first_capture_tick"]))
+        map_summary["captures"] += sum(result["captures"])
+        if result["first_capture_tick"] is not None:
+            map_summary["first_capture_ticks"].append(result["first_capture_tick"])
+
+        for i, ai_name in enumerate(result["roster"]):
+            ai_summary = summary["ais"].setdefault(ai_name, {"tanks": 0, "captures": 0, "kills": 0, "deaths": 0})
+            ai_summary["tanks"] += 1
+            ai_summary["captures"] += result["captures"][i]
+            ai_summary["kills"] += result["kills"][i]
+            ai_summary["deaths"] += result["deaths"][i]
+
+    for map_summary in summary["maps"].values():
+        first_capture_ticks = map_summary.pop("first_capture_ticks")
+        map_summary["matches_with_capture"] = len(first_capture_ticks)
+        map_summary["mean_first_capture_tick"] = sum(first_capture_ticks) / len(first_capture_ticks) if first_capture_ticks else None
+        # Number of different results: a single one over many matches means the seeds changed nothing
+        map_summary["distinct_outcomes"] = len(map_summary.pop("outcomes"))
+
+    return summary
+
+
+def write_json(path, results, summary):
+    with open(path, "w") as file:
+        json.dump({"summary": summary, "matches": results}, file, indent=2)
+
+
+def write_csv(path, results):
+    """ Writes one row per tank and match. """
+    fields = ["match", "seed", "map", "ticks", "tank", "ai", "captures", "kills", "deaths",
+              "first_capture_tick", "setup_seconds", "seconds", "ticks_per_second"]
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fields)
+        writer.writeheader()
+        for result in results:
+            for i, ai_name in enumerate(result["roster"]):
+                writer.writerow({
+                    "match": result["match"],
+                    "seed": result["seed"],
+                    "map": result["map"],
+                    "ticks": result["ticks"],
+                    "tank": i,
+                    "ai": ai_name,
+                    "captures": result["captures"][i],
+                    "kills": result["kills"][i],
+                    "deaths": result["deaths"][i],
+                    "first_capture_tick": result["first_capture_tick"],
+                    "setup_seconds": result["setup_seconds"],
+                    "seconds": result["seconds"],
+                    "ticks_per_second": result["ticks_per_second"],
+                    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Play headless AI-vs-AI matches on all CPU cores")
+    parser.add_argument("-n", "--matches", type = int, default = 100, help = "Number of matches to play")
+    parser.add_argument("--maps", nargs = "+", default = ["map0", "map1", "map2"], help = "Maps to play on, in turn")
+    parser.add_argument("--ticks", type = int, default = 50 * world.FRAMERATE, help = "Number of ticks in each match")
+    parser.add_argument("--roster", nargs = "+", help = "Ai class of each tank (default: an Ai on every start position)")
+    parser.add_argument("--seed", type = int, default = 0, help = "Seed of the first match")
+    parser.add_argument("-p", "--processes", type = int, help = "Number of worker processes (default: one per CPU core)")
+    parser.add_argument("--json", help = "Write the report to this JSON file")
+    parser.add_argument("--csv", help = "Write one row per tank and match to this CSV file")
+    args = parser.parse_args()
+
+    matches = make_matches(args.matches, args.maps, args.ticks, args.roster, args.seed)
+
+    start = time.perf_counter()
+    results = run_tournament(matches, args.processes)
+    summary = summarize(results, time.perf_counter() - start)
+
+    if args.json:
+        write_json(args.json, results, summary)
+    if args.csv:
+        write_csv(args.csv, results)
+    print(json.dumps(summary, indent=2))
+    for map_name, map_summary in summary["maps"].items():
+        if map_summary["matches"] > 1 and map_summary["distinct_outcomes"] == 1:
+            print(f"Warning: the {map_summary['matches']} matches on {map_name} all had the same result, "
+                  "the seeds made no difference", file = sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+import itertools
+import math
+import random
+import time
+
+import pymunk
+
+import ai
+import assets
+import entities
+import images
+import gameobjects
+import geometry
+import pathfinding
+import sounds
+import targeting
+
+#-- Constants
+FRAMERATE = 50 # Number of ticks in one second of game time
+UPDATE_INTERVAL = 3 # The objects update their speed every that many ticks
+SPAWN_JITTER = 0.1 # In a game with a seed, how far (in tiles) the tanks may start from their start position
+SPAWN_JITTER_ANGLE = 5 # and by how many degrees they may be turned
+
+
+def setup_headless():
+    """ Set the process up for games without a window: no asset is decoded (the
+        sprites are blank surfaces of the right size, see assets.py) and the
+        sound effects are muted. Called by the programs that play headless
+        (tournament.py, replay.py, bench.py), importing the world changes nothing.
+    """
+    if not assets.is_null():
+        assets.set_backend(assets.NullBackend())
+    sounds.bank.enabled = False
+
+
+class World:
+    """ The simulation of one game of capture the flag. It owns the physics
+        space and all the game objects, and advances them one tick at a time.
+        It never touches the window, the clock or the keyboard, so it can be
+        stepped as fast as the CPU allows.
+    """
+
+    def __init__(self, current_map, roster=None, seed=None):
+        """ Takes the map to play on and the roster, a list with one entry per
+            start position to fill: the Ai class driving that tank, or None for
+            a tank driven by the player. By default every start position gets an Ai.
+            A game always plays the same way from the same start. With a seed,
+            the tanks start slightly off their start positions (see SPAWN_JITTER),
+            differently for every seed, so that games with different seeds differ.
+        """
+        if roster is None:
+            roster = [ai.Ai] * len(current_map.start_positions)
+
+        self.current_map        = current_map
+        self.seed               = seed
+        self.rng                = random.Random(seed) if seed is not None else None
+        self.game_objects_list  = entities.EntityRegistry() # Every object of the game, except bullets and static objects
+        self.static_objects     = [] # Objects that never move nor change (rock boxes, bases)
+        self.static_version     = 0  # Increased every time static_objects changes
+        self.tanks_list         = []
+        self.ai_list            = []
+        self.players            = [] # Tanks that are driven by input rather than by an Ai
+        self.player_controls    = {} # Commands given to each player's tank every tick (CONTROL_* bits)
+        self.recorder           = None # Gets the commands given to every tank every tick, see replay.py
+        self.captures           = [] # (tick, tank index) for every flag capture
+        self.kills              = [0] * len(roster) # Number of tanks destroyed by each tank
+        self.deaths             = [0] * len(roster) # Number of times each tank was destroyed
+        self.ticks              = 0
+        self.despawn_queue      = {} # Objects that despawned during the tick (used as an ordered set)
+        self.pools              = {} # Despawned objects of each pooled class, to be spawned again
+
+        #-- Initialise the physics engine
+        self.space = pymunk.Space()
+        self.space.gravity = (0.0,  0.0)
+        self.space.damping = 0.1 # Adds friction to the ground for all objects
+
+        #-- Live state of the tiles, kept up to date as boxes get destroyed or pushed,
+        #   and the paths of the AIs that are computed from it
+        self.occupancy      = pathfinding.OccupancyGrid.from_map(current_map)
+        self.flow_fields    = pathfinding.FlowFields(self.occupancy)
+        self.targeting      = targeting.Targeting(self.space, self.occupancy, self.tanks_list)
+        self.boxes          = [] # Every box that can move or be destroyed, in the order they were created
+        self.box_tiles      = {} # Tile of every movable box
+        self.moving_boxes   = {} # Movable boxes that were pushed and may change tile (used as an ordered set)
+
+        #-- Bullets are recycled, and disappear once they flew further than the map diagonal
+        diagonal = math.hypot(current_map.width, current_map.height)
+        self.bullets = gameobjects.BulletPool(self.space, max_range=diagonal + 2)
+
+        self.create_boxes()
+        self.create_boundaries()
+        self.create_tanks(roster)
+
+        #-- Lets the AIs decide every tick, and spreads their path searches over the ticks if
+        #   given a budget (not by default, so that headless games always play the same)
+        self.ai_scheduler = ai.AiScheduler(self.ai_list)
+
+        #-- Create the flag
+        self.flag = gameobjects.Flag(current_map.flag_position[0], current_map.flag_position[1])
+        self.game_objects_list.append(self.flag)
+
+        #-- Create the bases
+        for i in range(0, len(self.tanks_list)):
+            pos = current_map.start_positions[i]
+            base = gameobjects.GameVisibleObject(pos[0], pos[1], images.bases[i % len(images.bases)])
+            self.add_static(base)
+
+        #-- Collision Handlers
+        self.collision_handlers = {} # Handler of the physics engine for each pair of collision types
+        for (type_a, type_b), callbacks in self.collision_table().items():
+            self.add_collision(type_a, type_b, **callbacks)
+
+    def collision_table(self):
+        """ Returns the interactions between the objects of the game: the callbacks
+            to call, for each pair of collision types, at the different stages of a
+            collision ("begin", "pre_solve", "post_solve" or "separate").
+        """
+        return {
+            (gameobjects.COLLISION_BULLET, gameobjects.COLLISION_BULLET): {"pre_solve": self.collide_bullet},
+            (gameobjects.COLLISION_BULLET, gameobjects.COLLISION_TANK):   {"pre_solve": self.collide_bullet},
+            (gameobjects.COLLISION_BULLET, gameobjects.COLLISION_BOX):    {"pre_solve": self.collide_bullet},
+            # Boxes pushed by tanks or by other boxes may end up on another tile
+            (gameobjects.COLLISION_TANK, gameobjects.COLLISION_BOX):      {"begin": self.push_box},
+            (gameobjects.COLLISION_BOX, gameobjects.COLLISION_BOX):       {"begin": self.push_box},
+            }
+
+    def add_collision(self, type_a, type_b, **callbacks):
+        """ Set the callbacks of the collisions between shapes of type_a and type_b,
+            for instance add_collision(COLLISION_BULLET, COLLISION_TANK, pre_solve=f).
+            The handler of the physics engine is only created the first time.
+        """
+        handler = self.collision_handlers.get((type_a, type_b))
+        if handler is None:
+            handler = self.space.add_collision_handler(type_a, type_b)
+            self.collision_handlers[(type_a, type_b)] = handler
+        for stage, callback in callbacks.items():
+            if stage not in ("begin", "pre_solve", "post_solve", "separate"):
+                raise ValueError(f"Unknown collision stage: {stage}")
+            setattr(handler, stage, callback)
+
+    def create_boxes(self):
+        """ Create a box for every tile of the map that isn't grass. Rock boxes never
+            move: their tiles are merged into a few rectangles of the static body of
+            the space, and they are only drawn.
+        """
+        geometry.add_static_rectangles(self.space, geometry.merge_tiles(self.occupancy, pathfinding.ROCKBOX))
+
+        for x in range(0, self.current_map.width):
+            for y in range(0,  self.current_map.height):
+                box_type = self.current_map.boxAt(x, y)
+                if box_type == pathfinding.ROCKBOX:
+                    self.add_static(gameobjects.GameVisibleObject(x + 0.5, y + 0.5, images.rockbox))
+                elif(box_type != 0):
+                    box = gameobjects.get_box_with_type(x, y, box_type, self.space)
+                    if box.movable:
+                        self.box_tiles[box] = (x, y)
+                    if box.movable or box.destructable:
+                        self.boxes.append(box)
+                        self.game_objects_list.append(box)
+                    else:
+                        self.add_static(box)
+
+    def create_boundaries(self):
+        """ Put a two tiles thick wall around the map. It is outside of the screen,
+            so it is only added to the physics engine.
+        """
+        rectangles = geometry.boundary_rectangles(self.current_map.width, self.current_map.height)
+        geometry.add_static_rectangles(self.space, rectangles)
+
+    def add_static(self, obj):
+        """ Add an object that never moves nor changes. Such objects are not
+            updated, and are drawn once into the static layer of the renderer.
+        """
+        self.static_objects.append(obj)
+        self.static_version += 1
+
+    def create_tanks(self, roster):
+        """ Create one tank per roster entry, on the start positions of the map. """
+        for i in range(0, len(roster)):
+            pos = self.current_map.start_positions[i]
+
+            scoreboard = gameobjects.Scoreboard(pos[0] + 0.3, pos[1], images.new_scoreboard[0])
+            tank = gameobjects.Tank(pos[0], pos[1], pos[2], images.tanks[i % len(images.tanks)], self.space, scoreboard)
+            tank.bullet_pool = self.bullets
+            if self.rng is not None:
+                # Off the start position, which stays where the tank has to bring the flag back
+                tank.body.position += (self.rng.uniform(-SPAWN_JITTER, SPAWN_JITTER),
+                                       self.rng.uniform(-SPAWN_JITTER, SPAWN_JITTER))
+                tank.body.angle += math.radians(self.rng.uniform(-SPAWN_JITTER_ANGLE, SPAWN_JITTER_ANGLE))
+            self.tanks_list.append(tank)
+            self.game_objects_list.append(tank)
+
+            if roster[i] is None:
+                self.players.append(tank)
+            else:
+                tank_ai = roster[i](tank, self.game_objects_list, self.tanks_list, self.space, self.current_map,
+                                     self.flow_fields, self.occupancy, self.targeting)
+                self.ai_list.append(tank_ai)
+
+    def step(self, n_ticks=1):
+        """ Advance the game by n_ticks ticks. """
+        for _ in range(n_ticks):
+            self.tick()
+
+    def tick(self):
+        """ Advance the game by a single tick. """
+        #-- See if the players have grabbed the flag
+        for tank in self.players:
+            tank.try_grab_flag(self.flag)
+
+        #-- See if a tank has won
+        self.check_captures()
+
+        #-- Update physics
+        if self.ticks % UPDATE_INTERVAL == 0:
+            # Loop over all the game objects and update their speed in function of their
+            # acceleration.
+            gameobjects.update_tanks(self.tanks_list)
+            for obj in self.game_objects_list.updating:
+                if not isinstance(obj, gameobjects.Tank):
+                    obj.update()
+            for bullet in self.bullets.live:
+                bullet.update()
+
+        #-- Let the players and the AIs control their tanks
+        self.decide()
+
+        #   Check collisions and update the objects position
+        self.space.step(1 / FRAMERATE)
+
+        #   Update object that depends on an other object position (for instance a flag)
+        for obj in self.game_objects_list.post_updating:
+            obj.post_update()
+            if not obj.alive:
+                self.despawn_queue[obj] = True
+        for bullet in self.bullets.live:
+            bullet.post_update()
+        self.bullets.expire()
+
+        self.despawn_dead_objects()
+
+        self.update_box_tiles()
+
+        self.ticks += 1
+
+    def decide(self):
+        """ The players' commands are given to their tanks, then the AIs decide. """
+        for tank in self.tanks_list:
+            tank.controls = 0
+
+        for tank in self.players:
+            self.apply_controls(tank, self.player_controls.get(tank, 0))
+
+        first_ai = self.ai_scheduler.first
+        self.ai_scheduler.run()
+
+        if self.recorder is not None:
+            self.recorder.record_tick(self, first_ai)
+
+    def set_controls(self, tank, controls):
+        """ Set the commands (CONTROL_* bits) given to the tank of a player on every tick, until changed. """
+        self.player_controls[tank] = controls
+
+    def apply_controls(self, tank, controls):
+        """ Give the commands of the controls (CONTROL_* bits) to the tank. Stopping
+            comes before moving or turning, as Tank.controls expects.
+        """
+        if controls & gameobjects.CONTROL_STOP:
+            tank.stop_moving()
+        if controls & gameobjects.CONTROL_ACCEL:
+            tank.accelerate()
+        if controls & gameobjects.CONTROL_DECEL:
+            tank.decelerate()
+        if controls & gameobjects.CONTROL_STOP_TURN:
+            tank.stop_turning()
+        if controls & gameobjects.CONTROL_LEFT:
+            tank.turn_left()
+        if controls & gameobjects.CONTROL_RIGHT:
+            tank.turn_right()
+        if controls & gameobjects.CONTROL_FIRE and tank.shot_cooldown == 0:
+            self.fire(tank)
+        if controls & gameobjects.CONTROL_GRAB:
+            tank.try_grab_flag(self.flag)
+
+    def spawn(self, cls, *args):
+        """ Add an object of class cls, built with args, to the game. Objects of
+            pooled classes are reused from the ones that despawned.
+        """
+        pool = self.pools.get(cls)
+        if pool:
+            obj = pool.pop()
+            obj.respawn(*args)
+            obj.alive = True
+        else:
+            obj = cls(*args)
+        self.game_objects_list.append(obj)
+        return obj
+
+    def despawn(self, obj):
+        """ Take an object out of the game at the end of the tick. Objects that
+            implement post_update() can also despawn themselves with obj.despawn().
+        """
+        obj.despawn()
+        self.despawn_queue[obj] = True
+
+    def despawn_dead_objects(self):
+        """ Take the objects that despawned during the tick out of the game. """
+        for obj in self.despawn_queue:
+            self.game_objects_list.discard(obj)
+            if obj.pooled:
+                self.pools.setdefault(type(obj), []).append(obj)
+        self.despawn_queue.clear()
+
+    def push_box(self, arb, space, data):
+        """ Remember the boxes that something started to push, to follow their tile. """
+        for shape in arb.shapes:
+            if shape.parent in self.box_tiles:
+                self.moving_boxes[shape.parent] = True
+        return True
+
+    def update_box_tiles(self):
+        """ Move the boxes that were pushed to another tile in the occupancy grid. """
+        # A box that came to rest against a tank doesn't start a new contact when
+        # the tank pushes it again, so all the boxes are checked once a second
+        if self.ticks % FRAMERATE == 0:
+            self.moving_boxes.update(dict.fromkeys(self.box_tiles, True))
+
+        for box in list(self.moving_boxes):
+            x, y = self.box_tiles[box]
+            new_x, new_y = int(box.body.position.x), int(box.body.position.y)
+            if (new_x, new_y) != (x, y):
+                box_type = pathfinding.WOODBOX if box.destructable else pathfinding.METALBOX
+                if self.occupancy.get(x, y) == box_type:
+                    self.occupancy.set(x, y, pathfinding.GRASS)
+                if self.occupancy.get(new_x, new_y) == pathfinding.GRASS:
+                    self.occupancy.set(new_x, new_y, box_type)
+                self.box_tiles[box] = (new_x, new_y)
+
+            # Stop following the box once it came to rest
+            if box.body.velocity.get_length_sqrd() < 1e-6:
+                del self.moving_boxes[box]
+
+    def check_captures(self):
+        """ Score a point for every tank that brought the flag back to its base. """
+        for i in range(len(self.tanks_list)):
+            victor = self.tanks_list[i]
+            if victor.has_won():
+                victor.scoreboard.add_score()
+                victor.scoreboard.sprite = victor.scoreboard.show_score
+                self.captures.append((self.ticks, i))
+                sounds.play("win")
+                self.respawn_tank(victor, True)
+
+    def fire(self, tank):
+        """ Make the tank shoot a bullet, taken from the bullet pool of the game. """
+        return tank.shoot(self.space)
+
+    def drawable_objects(self):
+        """ All the objects to draw on top of the static layer. """
+        return itertools.chain(self.game_objects_list.rendering, self.bullets.live)
+
+    def collide_bullet(self, arb, space, data):
+        """Handle bullet collision"""
+        bullet = arb.shapes[0].parent
+        collision_object = arb.shapes[1].parent
+
+        # A bullet touching two objects in the same step only hits the first one
+        if bullet not in self.bullets.live:
+            return True
+
+        # Remove the bullet from the game, to be fired again later
+        self.bullets.release(bullet)
+
+        # If it collides with a tank, respawn it
+        if isinstance(collision_object, gameobjects.Tank):
+            sounds.play("explosion")
+            collision_object.healthpoints -= 40
+            collision_object.lasthit = 250
+            if collision_object.healthpoints < 0:
+                collision_object.healthpoints = 100
+                self.count_kill(bullet.shooter, collision_object)
+                self.spawn(gameobjects.Explosion,
+                           collision_object.body.position.x,
+                           collision_object.body.position.y)
+                self.respawn_tank(collision_object)
+
+        # If it collides with a box, it may push it to another tile
+        if collision_object in self.box_tiles:
+            self.moving_boxes[collision_object] = True
+
+        # If it collides with a wooden box, destroy it
+        if isinstance(collision_object, gameobjects.Box):
+            if collision_object.destructable:
+
+                self.spawn(gameobjects.Explosion,
+                           collision_object.body.position.x,
+                           collision_object.body.position.y)
+
+                sounds.play("explosion")
+                self.destroy_box(arb, space)
+
+        return True
+
+    def count_kill(self, shooter, victim):
+        """ Keep track of who destroyed whom. """
+        self.deaths[self.tanks_list.index(victim)] += 1
+        if shooter is not victim:
+            self.kills[self.tanks_list.index(shooter)] += 1
+
+    def respawn_tank(self, tank, respawn_flag=False):
+        """Reset tank position to the base"""
+        death_positon = tank.body.position
+        tank.respawn_shield_timer = 250
+
+        # Set the flags new position depending on if the tank won or just got killed
+        if respawn_flag:
+            new_flag_pos = pymunk.Vec2d(self.current_map.flag_position[0], self.current_map.flag_position[1])
+        else:
+            new_flag_pos = pymunk.Vec2d(math.floor(death_positon.x)+0.5, math.floor(death_positon.y)+0.5)
+        tank.body.position = tank.start_position
+        tank.body.angle = tank.start_orientation
+        tank.body.velocity = pymunk.Vec2d(0, 0)
+
+        # If the tank carries the flag, reset the flag position
+        if tank.flag:
+            tank.flag.is_on_tank = False
+            tank.flag.orientation = 0
+
+            tank.flag.x, tank.flag.y = new_flag_pos.x, new_flag_pos.y
+
+            tank.flag = None
+
+    def destroy_box(self, arb, space):
+        """Destroy a box"""
+        box = arb.shapes[1].parent
+
+        # Remove the box from the game at the end of the tick
+        self.despawn(box)
+
+        # Clear its tile for the AIs
+        x, y = self.box_tiles.pop(box, (-1, -1))
+        self.moving_boxes.pop(box, None)
+        if self.occupancy.in_bounds(x, y):
+            self.occupancy.set(x, y, pathfinding.GRASS)
+
+        # Remove the box from the physics engine
+        space.remove(arb.shapes[1], arb.shapes[1].body)
+
+
+class FixedTimestep:
+    """ Runs a world at FRAMERATE ticks per second of real time, whatever the rate
+        at which advance() is called (for instance once per frame drawn on the
+        screen). The real time that went by is added to an accumulator, and as
+        many ticks as it holds are run: several per frame when drawing is slow,
+        none on some frames when it is faster than the game.
+    """
+
+    def __init__(self, world, max_ticks=10, clock=time.perf_counter):
+        """ At most max_ticks ticks are run per call: if the game can't keep up
+            with real time, it slows down instead of falling further and further behind.
+        """
+        self.world          = world
+        self.max_ticks      = max_ticks
+        self.clock          = clock
+        self.accumulator    = 0.0  # Real time, in seconds, that hasn't been simulated yet
+        self.last_time      = None # Time of the previous call
+        self.dropped_ticks  = 0    # Ticks that were skipped because the game couldn't keep up
+
+    def advance(self):
+        """ Run the ticks that are due since the previous call, returns their number. """
+        now = self.clock()
+        if self.last_time is not None:
+            self.accumulator += now - self.last_time
+        self.last_time = now
+
+        n_ticks = int(self.accumulator * FRAMERATE)
+        if n_ticks > self.max_ticks:
+            self.dropped_ticks += n_ticks - self.max_ticks
+            n_ticks = self.max_ticks
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= n_ticks / FRAMERATE
+
+        self.world.step(n_ticks)
+        return n_ticks